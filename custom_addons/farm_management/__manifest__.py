@@ -38,6 +38,7 @@
         'data/farm_products.xml',
         'data/farm_config_data.xml',
         'data/farm_landed_cost_data.xml',
+        'data/farm_cron_data.xml',
         # Views
         'views/farm_views.xml',
         'views/farm_project_views.xml',
@@ -46,6 +47,7 @@
         'views/farm_product_order_views.xml',
         'views/account_account_views.xml',
         'views/farm_inventory_config_views.xml',
+        'views/farm_job_views.xml',
         'views/res_config_settings_views.xml',
         'views/sale_order_pallet_views.xml',
         'views/res_partner_views.xml',
@@ -67,6 +69,7 @@
     'assets': {
         'web.assets_backend': [
             'farm_management/static/src/css/farm_timeline.css',
+            'farm_management/static/src/packing_screen/*',
         ],
     },
     'installable': True,
@@ -1,37 +1,27 @@
 # -*- coding: utf-8 -*-
 """
 Custom report controller for pallet labels.
-Uses wkhtmltoimage for HTML to image rendering.
-Creates PDF with exact image dimensions for true roll printing.
+Serves the labels rendered by services/pallet_label_renderer.py: a PDF with
+exact image dimensions for true roll printing, either as one stitched page or
+streamed with one page per label (layout=pages), or printer-native commands.
 """
 
-import base64
-import io
+import itertools
 import logging
-import os
-import subprocess
-import tempfile
 
 from odoo import http
 from odoo.http import request, content_disposition
 
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.utils import ImageReader
-    from PIL import Image
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
-
-try:
-    from playwright.sync_api import sync_playwright
-    PLAYWRIGHT_AVAILABLE = True
-except ImportError:
-    PLAYWRIGHT_AVAILABLE = False
-    sync_playwright = None
+from ..services.pallet_label_renderer import REPORTLAB_AVAILABLE, PalletLabelRenderer
 
 _logger = logging.getLogger(__name__)
 
+# output parameter -> (content type, file extension)
+NATIVE_FORMATS = {
+    'zpl': ('text/plain; charset=utf-8', 'zpl'),
+    'escpos': ('application/octet-stream', 'bin'),
+}
+
 
 class PalletLabelController(http.Controller):
     
@@ -40,7 +30,22 @@ class PalletLabelController(http.Controller):
         """
         Custom endpoint for pallet label printing.
         Renders each pallet as HTML -> Image (via Playwright) -> PDF with exact height.
-        """
+        With batch=1, all labels are rendered from a single page load.
+        With output=zpl or output=escpos, printer-native commands are returned
+        instead of a PDF (see _print_native_labels).
+        With layout=pages, the PDF is streamed with one page per label.
+        With color=mono or color=mono_dither, labels are 1-bit images at the
+        printer resolution (default from the settings).
+        """
+        output = kwargs.get('output')
+        if output in NATIVE_FORMATS:
+            return self._print_native_labels(pallet_ids, output)
+        
+        batch = kwargs.get('batch') in ('1', 'true', 'True')
+        color = kwargs.get('color')
+        if kwargs.get('layout') == 'pages':
+            return self._stream_label_pages(pallet_ids, batch=batch, color=color)
+        
         if not REPORTLAB_AVAILABLE:
             _logger.warning("reportlab not available, falling back to standard PDF")
             return self._fallback_to_standard_report(pallet_ids)
@@ -56,7 +61,7 @@ class PalletLabelController(http.Controller):
                 return request.not_found()
             
             # Generate PDF with image-based pages
-            pdf_content = self._generate_image_based_pdf(pallets)
+            pdf_content = PalletLabelRenderer().generate_image_pdf(pallets, batch=batch, color=color)
             
             if not pdf_content:
                 return self._fallback_to_standard_report(pallet_ids)
@@ -78,210 +83,84 @@ class PalletLabelController(http.Controller):
             _logger.exception("Error generating pallet label PDF: %s", e)
             return self._fallback_to_standard_report(pallet_ids)
     
-    def _generate_image_based_pdf(self, pallets):
+    def _print_native_labels(self, pallet_ids, output):
         """
-        Generate PDF where each page is an image of the rendered label.
-        Page height matches image height for true roll printing.
+        Return the labels as ZPL or ESC/POS for thermal roll printers.
+        Barcodes are printed by the printer, so no HTML or image rendering is needed.
         """
-        images = []
+        ids = [int(x) for x in pallet_ids.split(',') if x.strip().isdigit()]
+        pallets = request.env['sale.order.pallet'].browse(ids).exists()
+        if not pallets:
+            return request.not_found()
         
-        for pallet in pallets:
-            img_bytes = self._render_pallet_to_image(pallet)
-            if img_bytes:
-                images.append(img_bytes)
+        content = PalletLabelRenderer().build_native_labels(pallets, output)
         
-        if not images:
-            return None
+        content_type, extension = NATIVE_FORMATS[output]
+        if len(pallets) == 1:
+            filename = f"pallet_label_{pallets[0].name}.{extension}"
+        else:
+            filename = f"pallet_labels_{pallets[0].order_id.name}.{extension}"
         
-        return self._create_pdf_from_images(images)
+        return request.make_response(
+            content,
+            headers=[
+                ('Content-Type', content_type),
+                ('Content-Disposition', content_disposition(filename)),
+            ]
+        )
     
-    def _render_pallet_to_image(self, pallet):
+    def _stream_label_pages(self, pallet_ids, batch=False, color=None):
         """
-        Render a single pallet's label HTML to PNG image.
-        Uses Playwright for high-quality rendering if available, falls back to wkhtmltoimage.
+        Stream the labels as a PDF with one roll-sized page per label.
+        Cache lookups and label HTML are done up front, since the database
+        cursor is gone once the response is returned; the images are rendered
+        and written to the client one after the other while the response is
+        sent, and new renderings are cached from a cursor of their own.
         """
+        ids = [int(x) for x in pallet_ids.split(',') if x.strip().isdigit()]
+        pallets = request.env['sale.order.pallet'].browse(ids).exists()
+        if not pallets:
+            return request.not_found()
+        
+        renderer = PalletLabelRenderer()
+        output_format, convert = renderer.get_label_raster(pallets.env, color)
+        keys, cached, documents = renderer.prepare_label_images(pallets, batch=batch, output_format=output_format)
+        if not cached and not documents:
+            return self._fallback_to_standard_report(pallet_ids)
+        
+        env = request.env
+        
+        def store(images):
+            try:
+                with env.registry.cursor() as cr:
+                    env(cr=cr)['sale.order.pallet']._store_label_images(images, keys, output_format)
+            except Exception:
+                _logger.exception("Could not cache rendered pallet labels")
+        
+        chunks = renderer.generate_label_pages(
+            pallets.ids, cached, documents, renderer.get_browser_max_renders(env), store, convert,
+        )
         try:
-            # Render the QWeb template to HTML
-            html = self._render_label_html(pallet)
-            
-            if not html:
-                return None
-            
-            # Try Playwright first for best quality
-            if PLAYWRIGHT_AVAILABLE:
-                try:
-                    return self._render_with_playwright(html)
-                except Exception as e:
-                    _logger.warning("Playwright rendering failed, trying wkhtmltoimage: %s", e)
-            
-            # Fallback to wkhtmltoimage
-            return self._render_with_wkhtmltoimage(html)
-                    
+            # Render the first label before answering, while we can still fall back
+            first_chunk = next(chunks)
         except Exception as e:
-            _logger.exception("Error rendering pallet to image: %s", e)
-            return None
-    
-    def _render_with_playwright(self, html):
-        """
-        Render HTML to PNG using Playwright (headless Chromium).
-        Sync API - works well in Odoo's synchronous request handling.
-        """
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
-            
-            try:
-                # Start with small viewport to avoid min-height issues
-                page = browser.new_page(
-                    viewport={'width': 400, 'height': 100},
-                    device_scale_factor=2,  # 2x for high DPI quality
-                )
-                
-                # Set content
-                page.set_content(html, wait_until='networkidle')
-                
-                # Wait for fonts to load
-                page.wait_for_timeout(300)
-                
-                # Get actual content height from the pallet-label div
-                content_height = page.evaluate('''() => {
-                    const label = document.querySelector('.pallet-label');
-                    if (label) {
-                        return label.offsetHeight + 20;  // Add small padding
-                    }
-                    return document.body.scrollHeight;
-                }''')
-                
-                # Resize viewport to actual content
-                page.set_viewport_size({'width': 400, 'height': content_height})
-                
-                # Take screenshot of just the content (not full page)
-                screenshot = page.screenshot(
-                    type='png',
-                    clip={'x': 0, 'y': 0, 'width': 400, 'height': content_height},
-                )
-                
-                return screenshot
-                
-            finally:
-                browser.close()
-    
-    def _render_with_wkhtmltoimage(self, html):
-        """
-        Fallback: Render HTML to PNG using wkhtmltoimage.
-        """
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as html_file:
-            html_file.write(html)
-            html_path = html_file.name
+            _logger.exception("Error generating pallet label pages: %s", e)
+            return self._fallback_to_standard_report(pallet_ids)
         
-        png_path = html_path.replace('.html', '.png')
+        if len(pallets) == 1:
+            filename = f"pallet_label_{pallets[0].name}.pdf"
+        else:
+            filename = f"pallet_labels_{pallets[0].order_id.name}.pdf"
         
-        try:
-            cmd = [
-                'wkhtmltoimage',
-                '--width', '400',
-                '--quality', '95',
-                '--disable-smart-width',
-                '--encoding', 'utf-8',
-                html_path,
-                png_path
+        response = request.make_response(
+            itertools.chain([first_chunk], chunks),
+            headers=[
+                ('Content-Type', 'application/pdf'),
+                ('Content-Disposition', content_disposition(filename)),
             ]
-            
-            result = subprocess.run(cmd, capture_output=True, timeout=30)
-            
-            if result.returncode != 0:
-                _logger.warning("wkhtmltoimage failed: %s", result.stderr.decode('utf-8', errors='ignore'))
-                return None
-            
-            with open(png_path, 'rb') as f:
-                return f.read()
-                
-        finally:
-            if os.path.exists(html_path):
-                os.unlink(html_path)
-            if os.path.exists(png_path):
-                os.unlink(png_path)
-    
-    def _render_label_html(self, pallet):
-        """
-        Render the pallet label QWeb template to HTML string.
-        """
-        try:
-            import datetime
-            
-            values = {
-                'docs': pallet,
-                'pallet': pallet,
-                'context_timestamp': lambda dt: dt,
-                'datetime': datetime,
-                'image_data_uri': self._image_to_data_uri,
-            }
-            
-            html = request.env['ir.qweb']._render(
-                'farm_management.report_pallet_label_standalone',
-                values,
-            )
-            
-            return html
-            
-        except Exception as e:
-            _logger.exception("Error rendering label HTML: %s", e)
-            return None
-    
-    def _image_to_data_uri(self, image_data):
-        """Convert binary image data to data URI for embedding in HTML."""
-        if not image_data:
-            return ''
-        try:
-            encoded = base64.b64encode(image_data).decode('utf-8')
-            return f'data:image/png;base64,{encoded}'
-        except Exception:
-            return ''
-    
-    def _create_pdf_from_images(self, images):
-        """
-        Create a single-page PDF with all images stitched vertically.
-        Adds padding between each label for visual separation.
-        Ideal for continuous roll printing.
-        """
-        try:
-            # Padding between images (in pixels)
-            PADDING = 40
-            
-            # Open all images and get dimensions
-            pil_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in images]
-            
-            # Calculate combined dimensions
-            width = max(img.width for img in pil_images)
-            total_height = sum(img.height for img in pil_images) + (PADDING * (len(pil_images) - 1))
-            
-            # Create combined image with white background
-            combined = Image.new('RGB', (width, total_height), 'white')
-            
-            # Paste each image with padding
-            y_offset = 0
-            for img in pil_images:
-                combined.paste(img, (0, y_offset))
-                y_offset += img.height + PADDING
-            
-            # Create single-page PDF
-            output = io.BytesIO()
-            c = canvas.Canvas(output, pagesize=(width, total_height))
-            
-            combined_bytes = io.BytesIO()
-            combined.save(combined_bytes, format='PNG')
-            combined_bytes.seek(0)
-            
-            c.drawImage(ImageReader(combined_bytes), 0, 0, width, total_height)
-            c.save()
-            
-            return output.getvalue()
-            
-        except Exception as e:
-            _logger.exception("Error creating PDF from images: %s", e)
-            return None
+        )
+        response.direct_passthrough = True
+        return response
     
     def _fallback_to_standard_report(self, pallet_ids):
         """
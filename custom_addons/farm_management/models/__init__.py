@@ -14,4 +14,5 @@ from . import stock_landed_cost
 from . import sale_order
 from . import sale_order_pallet
 from . import res_partner
-
+from . import farm_job
+from . import ir_websocket
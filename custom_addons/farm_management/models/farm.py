@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+
+# Levels whose full_name is "<parent full name> / <name>":
+# (model, table, parent table, parent column, parent name column)
+FULL_NAME_LEVELS = [
+    ('farm.sector', 'farm_sector', 'farm_farm', 'farm_id', 'name'),
+    ('farm.unit', 'farm_unit', 'farm_sector', 'sector_id', 'full_name'),
+    ('farm.house', 'farm_house', 'farm_unit', 'unit_id', 'full_name'),
+]
 
 
 class Farm(models.Model):
@@ -51,40 +60,76 @@ class Farm(models.Model):
     sector_count = fields.Integer(
         string='عدد القطاعات',
         compute='_compute_counts',
+        store=True,
     )
     unit_count = fields.Integer(
         string='عدد الوحدات',
         compute='_compute_counts',
+        store=True,
     )
     house_count = fields.Integer(
         string='عدد البيوت',
         compute='_compute_counts',
+        store=True,
     )
     total_area = fields.Float(
         string='إجمالي المساحة (م²)',
         compute='_compute_counts',
+        store=True,
     )
     project_count = fields.Integer(
         string='عدد المشاريع',
         compute='_compute_project_count',
     )
+    project_draft_count = fields.Integer(
+        string='مشاريع مسودة',
+        compute='_compute_project_count',
+    )
+    project_in_progress_count = fields.Integer(
+        string='مشاريع قيد التنفيذ',
+        compute='_compute_project_count',
+    )
+    project_paused_count = fields.Integer(
+        string='مشاريع متوقفة مؤقتاً',
+        compute='_compute_project_count',
+    )
+    project_completed_count = fields.Integer(
+        string='مشاريع مكتملة',
+        compute='_compute_project_count',
+    )
 
-    @api.depends('sector_ids', 'sector_ids.unit_ids', 'sector_ids.unit_ids.house_ids')
+    @api.depends('sector_ids.active', 'sector_ids.unit_count',
+                 'sector_ids.house_count', 'sector_ids.total_area')
     def _compute_counts(self):
+        """Roll up the stored sector totals with one grouped query"""
+        groups = self.env['farm.sector']._read_group(
+            [('farm_id', 'in', self.ids)],
+            ['farm_id'],
+            ['__count', 'unit_count:sum', 'house_count:sum', 'total_area:sum'],
+        )
+        totals = {farm.id: rest for farm, *rest in groups}
         for farm in self:
-            sectors = farm.sector_ids
-            units = sectors.mapped('unit_ids')
-            houses = units.mapped('house_ids')
-            farm.sector_count = len(sectors)
-            farm.unit_count = len(units)
-            farm.house_count = len(houses)
-            farm.total_area = sum(houses.mapped('area'))
+            sector_count, unit_count, house_count, total_area = totals.get(farm._origin.id, (0, 0, 0, 0.0))
+            farm.sector_count = sector_count
+            farm.unit_count = unit_count
+            farm.house_count = house_count
+            farm.total_area = total_area
 
     def _compute_project_count(self):
+        counts = self.env['farm.project']._count_projects_by('farm_id', self._origin.ids)
         for farm in self:
-            farm.project_count = self.env['farm.project'].search_count([
-                ('farm_id', '=', farm.id)
-            ])
+            by_status = counts.get(farm._origin.id, {})
+            farm.project_count = sum(by_status.values())
+            farm.project_draft_count = by_status.get('draft', 0)
+            farm.project_in_progress_count = by_status.get('in_progress', 0)
+            farm.project_paused_count = by_status.get('paused', 0)
+            farm.project_completed_count = by_status.get('completed', 0)
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals:
+            self.env['farm.house']._cascade_full_names('farm.sector', 'farm_id', self.ids)
+        return res
 
     def action_view_sectors(self):
         self.ensure_one()
@@ -114,7 +159,7 @@ class Farm(models.Model):
             'name': 'البيوت',
             'res_model': 'farm.house',
             'view_mode': 'tree,kanban,form',
-            'domain': [('unit_id.sector_id.farm_id', '=', self.id)],
+            'domain': self.env['farm.house']._get_subtree_domain(farms=self),
         }
 
     def action_view_projects(self):
@@ -174,17 +219,24 @@ class Sector(models.Model):
     unit_count = fields.Integer(
         string='عدد الوحدات',
         compute='_compute_counts',
+        store=True,
     )
     house_count = fields.Integer(
         string='عدد البيوت',
         compute='_compute_counts',
+        store=True,
     )
     total_area = fields.Float(
         string='إجمالي المساحة (م²)',
         compute='_compute_counts',
+        store=True,
+    )
+    project_count = fields.Integer(
+        string='عدد المشاريع',
+        compute='_compute_project_count',
     )
 
-    @api.depends('name', 'farm_id.name')
+    @api.depends('name', 'farm_id')
     def _compute_full_name(self):
         for sector in self:
             if sector.farm_id:
@@ -192,14 +244,26 @@ class Sector(models.Model):
             else:
                 sector.full_name = sector.name
 
-    @api.depends('unit_ids', 'unit_ids.house_ids')
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals or 'farm_id' in vals:
+            self.env['farm.house']._cascade_full_names('farm.unit', 'sector_id', self.ids)
+        return res
+
+    @api.depends('unit_ids.active', 'unit_ids.house_count', 'unit_ids.total_area')
     def _compute_counts(self):
+        """Roll up the stored unit totals with one grouped query"""
+        groups = self.env['farm.unit']._read_group(
+            [('sector_id', 'in', self.ids)],
+            ['sector_id'],
+            ['__count', 'house_count:sum', 'total_area:sum'],
+        )
+        totals = {sector.id: rest for sector, *rest in groups}
         for sector in self:
-            units = sector.unit_ids
-            houses = units.mapped('house_ids')
-            sector.unit_count = len(units)
-            sector.house_count = len(houses)
-            sector.total_area = sum(houses.mapped('area'))
+            unit_count, house_count, total_area = totals.get(sector._origin.id, (0, 0, 0.0))
+            sector.unit_count = unit_count
+            sector.house_count = house_count
+            sector.total_area = total_area
 
     def action_view_units(self):
         self.ensure_one()
@@ -219,7 +283,22 @@ class Sector(models.Model):
             'name': 'البيوت',
             'res_model': 'farm.house',
             'view_mode': 'tree,kanban,form',
-            'domain': [('unit_id.sector_id', '=', self.id)],
+            'domain': self.env['farm.house']._get_subtree_domain(sectors=self),
+        }
+
+    def _compute_project_count(self):
+        counts = self.env['farm.project']._count_projects_by('sector_id', self._origin.ids)
+        for sector in self:
+            sector.project_count = sum(counts.get(sector._origin.id, {}).values())
+
+    def action_view_projects(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'المشاريع',
+            'res_model': 'farm.project',
+            'view_mode': 'tree,kanban,form',
+            'domain': [('house_assignment_ids.sector_id', '=', self.id)],
         }
 
 
@@ -276,13 +355,19 @@ class Unit(models.Model):
     house_count = fields.Integer(
         string='عدد البيوت',
         compute='_compute_counts',
+        store=True,
     )
     total_area = fields.Float(
         string='إجمالي المساحة (م²)',
         compute='_compute_counts',
+        store=True,
+    )
+    project_count = fields.Integer(
+        string='عدد المشاريع',
+        compute='_compute_project_count',
     )
 
-    @api.depends('name', 'sector_id.full_name')
+    @api.depends('name', 'sector_id')
     def _compute_full_name(self):
         for unit in self:
             if unit.sector_id:
@@ -290,12 +375,25 @@ class Unit(models.Model):
             else:
                 unit.full_name = unit.name
 
-    @api.depends('house_ids', 'house_ids.area')
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals or 'sector_id' in vals:
+            self.env['farm.house']._cascade_full_names('farm.house', 'unit_id', self.ids)
+        return res
+
+    @api.depends('house_ids.active', 'house_ids.area')
     def _compute_counts(self):
+        """Count and sum the active houses of the units with one grouped query"""
+        groups = self.env['farm.house']._read_group(
+            [('unit_id', 'in', self.ids)],
+            ['unit_id'],
+            ['__count', 'area:sum'],
+        )
+        totals = {unit.id: rest for unit, *rest in groups}
         for unit in self:
-            houses = unit.house_ids
-            unit.house_count = len(houses)
-            unit.total_area = sum(houses.mapped('area'))
+            house_count, total_area = totals.get(unit._origin.id, (0, 0.0))
+            unit.house_count = house_count
+            unit.total_area = total_area
 
     def action_view_houses(self):
         self.ensure_one()
@@ -308,6 +406,21 @@ class Unit(models.Model):
             'context': {'default_unit_id': self.id},
         }
 
+    def _compute_project_count(self):
+        counts = self.env['farm.project']._count_projects_by('unit_id', self._origin.ids)
+        for unit in self:
+            unit.project_count = sum(counts.get(unit._origin.id, {}).values())
+
+    def action_view_projects(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'المشاريع',
+            'res_model': 'farm.project',
+            'view_mode': 'tree,kanban,form',
+            'domain': [('house_assignment_ids.unit_id', '=', self.id)],
+        }
+
 
 class House(models.Model):
     _name = 'farm.house'
@@ -377,8 +490,50 @@ class House(models.Model):
         compute='_compute_full_name',
         store=True,
     )
+    project_count = fields.Integer(
+        string='عدد المشاريع',
+        compute='_compute_project_count',
+    )
+    hierarchy_path = fields.Char(
+        string='مسار الهيكل',
+        compute='_compute_hierarchy_path',
+        store=True,
+        help='/المزرعة/القطاع/الوحدة/ لاستعلامات الفروع السريعة',
+    )
+
+    def init(self):
+        # Prefix searches (LIKE '/1/2/%') need text_pattern_ops outside the C locale
+        tools.create_index(
+            self.env.cr, 'farm_house_hierarchy_path_index', self._table,
+            ['hierarchy_path text_pattern_ops'],
+        )
 
-    @api.depends('name', 'unit_id.full_name')
+    @api.depends('farm_id', 'sector_id', 'unit_id')
+    def _compute_hierarchy_path(self):
+        for house in self:
+            house.hierarchy_path = f"/{house.farm_id.id}/{house.sector_id.id}/{house.unit_id.id}/"
+
+    @api.model
+    def _get_subtree_domain(self, farms=None, sectors=None, units=None):
+        """
+        Domain of the houses under any of the given farms, sectors or units,
+        resolved with one indexed prefix search on hierarchy_path.
+        """
+        prefixes = [f"/{farm.id}/" for farm in (farms or [])]
+        prefixes += [f"/{sector.farm_id.id}/{sector.id}/" for sector in (sectors or [])]
+        prefixes += [f"/{unit.farm_id.id}/{unit.sector_id.id}/{unit.id}/" for unit in (units or [])]
+        if not prefixes:
+            return expression.FALSE_DOMAIN
+        return expression.OR([[('hierarchy_path', '=like', f"{prefix}%")] for prefix in prefixes])
+
+    @api.model
+    def _get_subtree_houses(self, farms=None, sectors=None, units=None):
+        """Active houses under any of the given farms, sectors or units"""
+        if not (farms or sectors or units):
+            return self.browse()
+        return self.search(self._get_subtree_domain(farms, sectors, units))
+
+    @api.depends('name', 'unit_id')
     def _compute_full_name(self):
         for house in self:
             if house.unit_id:
@@ -389,31 +544,131 @@ class House(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
-        for record in records:
-            record._create_analytic_account()
+        records._create_analytic_accounts()
         return records
 
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals or 'unit_id' in vals:
+            self._sync_analytic_account_names()
+        return res
+
+    @api.model
+    def _cascade_full_names(self, model_name, column, ids):
+        """
+        Rebuild the stored full names below renamed or moved records with one
+        UPDATE per level, instead of recomputing every descendant in Python.
+
+        :param model_name: first level to rebuild ('farm.sector', 'farm.unit'
+            or 'farm.house'); the levels below it follow
+        :param column: column of every rebuilt level pointing to the changed
+            records ('farm_id', 'sector_id' or 'unit_id')
+        :param ids: ids of the changed records
+        """
+        if not ids:
+            return
+        self.env.flush_all()
+        start = [level[0] for level in FULL_NAME_LEVELS].index(model_name)
+        house_ids = []
+        for child_model, child_table, parent_table, parent_column, parent_name in FULL_NAME_LEVELS[start:]:
+            self.env.cr.execute(f"""
+                UPDATE {child_table} AS child
+                   SET full_name = parent.{parent_name} || ' / ' || child.name
+                  FROM {parent_table} AS parent
+                 WHERE parent.id = child.{parent_column}
+                   AND child.{column} = ANY(%s)
+                   AND child.full_name IS DISTINCT FROM parent.{parent_name} || ' / ' || child.name
+             RETURNING child.id
+            """, [list(ids)])
+            updated_ids = [row[0] for row in self.env.cr.fetchall()]
+            self.env[child_model].invalidate_model(['full_name'])
+            if child_model == 'farm.house':
+                house_ids = updated_ids
+        self.browse(house_ids)._sync_analytic_account_names()
+
+    def _sync_analytic_account_names(self):
+        """Rename the analytic accounts of these houses after their full name, when enabled"""
+        if not self or self.env['ir.config_parameter'].sudo().get_param(
+                'farm_management.sync_analytic_names') not in ('True', '1'):
+            return
+        self.flush_recordset(['full_name', 'analytic_account_id'])
+        Account = self.env['account.analytic.account']
+        Account.flush_model(['name'])
+        if Account._fields['name'].translate:
+            lang = self.env.lang or 'en_US'
+            new_name = "account.name || jsonb_build_object('en_US', house.full_name, %(lang)s, house.full_name)"
+            current_name = "COALESCE(account.name->>%(lang)s, account.name->>'en_US')"
+        else:
+            lang = None
+            new_name = "house.full_name"
+            current_name = "account.name"
+        # One UPDATE for all the accounts, the names are taken from the houses
+        self.env.cr.execute(f"""
+            UPDATE account_analytic_account AS account
+               SET name = {new_name},
+                   write_uid = %(uid)s,
+                   write_date = (now() AT TIME ZONE 'UTC')
+              FROM farm_house AS house
+             WHERE house.analytic_account_id = account.id
+               AND house.id = ANY(%(ids)s)
+               AND {current_name} IS DISTINCT FROM house.full_name
+        """, {'lang': lang, 'uid': self.env.uid, 'ids': self.ids})
+        Account.invalidate_model(['name', 'write_uid', 'write_date'])
+
+    @api.model
+    def _get_analytic_plan(self):
+        """Find or create the farm analytic plan"""
+        plan = self.env['account.analytic.plan'].search([
+            ('name', '=', 'مشاريع المزارع')
+        ], limit=1)
+        if not plan:
+            plan = self.env['account.analytic.plan'].create({
+                'name': 'مشاريع المزارع',
+                'description': 'خطة تحليلية لمشاريع المزارع',
+            })
+        return plan
+
     def _create_analytic_account(self):
         """Create analytic account for the house automatically"""
         self.ensure_one()
-        if not self.analytic_account_id:
-            # Find or create the farm analytic plan
-            plan = self.env['account.analytic.plan'].search([
-                ('name', '=', 'مشاريع المزارع')
-            ], limit=1)
-            if not plan:
-                plan = self.env['account.analytic.plan'].create({
-                    'name': 'مشاريع المزارع',
-                    'description': 'خطة تحليلية لمشاريع المزارع',
-                })
-            
-            analytic_account = self.env['account.analytic.account'].create({
-                'name': self.full_name,
-                'code': f"HOUSE-{self.id}",
-                'plan_id': plan.id,
-                'company_id': self.farm_id.company_id.id if self.farm_id else self.env.company.id,
-            })
-            self.analytic_account_id = analytic_account.id
+        self._create_analytic_accounts()
+
+    def _create_analytic_accounts(self):
+        """
+        Create the analytic accounts of the houses that have none, with one
+        plan lookup, one create and one update. Above the configured threshold
+        (large imports) the accounts are created by a background job instead.
+        """
+        houses = self.filtered(lambda house: not house.analytic_account_id)
+        if not houses:
+            return
+
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.house_analytic_async_threshold', default=500
+        ) or 0)
+        if threshold and len(houses) > threshold and not self.env.context.get('farm_job_id'):
+            self.env['farm.job']._enqueue(
+                _('إنشاء الحسابات التحليلية للبيوت'), self._name, '_create_analytic_accounts',
+                houses.ids, chunk_size=500,
+            )
+            return
+
+        plan = self._get_analytic_plan()
+        accounts = self.env['account.analytic.account'].create([{
+            'name': house.full_name,
+            'code': f"HOUSE-{house.id}",
+            'plan_id': plan.id,
+            'company_id': house.farm_id.company_id.id if house.farm_id else self.env.company.id,
+        } for house in houses])
+
+        self.env.cr.execute("""
+            UPDATE farm_house
+               SET analytic_account_id = link.account_id
+              FROM unnest(%s::int[], %s::int[]) AS link(house_id, account_id)
+             WHERE farm_house.id = link.house_id
+        """, [houses.ids, accounts.ids])
+        houses.invalidate_recordset(['analytic_account_id'])
+        houses.modified(['analytic_account_id'])
 
     @api.constrains('area')
     def _check_area(self):
@@ -425,3 +680,17 @@ class House(models.Model):
         for house in self:
             house.display_name = house.name
 
+    def _compute_project_count(self):
+        counts = self.env['farm.project']._count_projects_by('house_id', self._origin.ids)
+        for house in self:
+            house.project_count = sum(counts.get(house._origin.id, {}).values())
+
+    def action_view_projects(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'المشاريع',
+            'res_model': 'farm.project',
+            'view_mode': 'tree,kanban,form',
+            'domain': [('house_assignment_ids.house_id', '=', self.id)],
+        }
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 
@@ -169,24 +171,28 @@ class FarmHarvestEntry(models.Model):
         
         records = super().create(vals_list)
         
-        # Calculate cost allocation, create stock move and harvest cost for each new entry
+        # Calculate cost allocation for all affected houses in one pass
+        self._recalculate_cost_allocation(records.mapped('project_house_id'))
+        
+        # Create stock move and harvest cost for each new entry
         for record in records:
-            record._calculate_cost_allocation()
             record._create_stock_move()
             record._create_harvest_cost()
         
         return records
 
     def write(self, vals):
+        # Keep the previous houses: an entry moved to another house changes both sequences
+        project_houses = self.mapped('project_house_id')
         result = super().write(vals)
         
-        # Recalculate if quantity changed
+        # Recalculate if quantity or ordering changed
+        if any(field in vals for field in ('quantity', 'date', 'project_house_id')):
+            self._recalculate_cost_allocation(project_houses | self.mapped('project_house_id'))
+        
+        # Update stock move quantity
         if 'quantity' in vals:
             for record in self:
-                record._calculate_cost_allocation()
-                # Recalculate subsequent entries
-                record._recalculate_subsequent_entries()
-                # Update stock move quantity
                 record._update_stock_move()
         
         return result
@@ -209,10 +215,7 @@ class FarmHarvestEntry(models.Model):
         result = super().unlink()
         
         # Recalculate remaining entries for affected project houses
-        for ph in project_houses:
-            entries = self.search([('project_house_id', '=', ph.id)], order='date, id')
-            for entry in entries:
-                entry._calculate_cost_allocation()
+        self._recalculate_cost_allocation(project_houses)
         
         return result
 
@@ -234,91 +237,167 @@ class FarmHarvestEntry(models.Model):
 
     @api.depends('project_house_id', 'date', 'quantity', 'allocated_cost')
     def _compute_cumulative(self):
+        # Running totals of saved entries come from one window query
+        saved_entries = self.filtered('id')
+        cumulative = saved_entries._get_cumulative_values()
+        
         for entry in self:
-            # Skip if record is not saved yet (NewId)
-            if not entry.id or isinstance(entry.id, models.NewId):
+            if entry in saved_entries:
+                entry.cumulative_harvested, entry.cumulative_allocated = cumulative.get(entry.id, (0.0, 0.0))
+            else:
+                # Record is not saved yet (NewId)
                 entry.cumulative_harvested = entry.quantity or 0
                 entry.cumulative_allocated = entry.allocated_cost or 0
-                if entry.expected_qty:
-                    entry.cumulative_progress = (entry.cumulative_harvested / entry.expected_qty) * 100
-                else:
-                    entry.cumulative_progress = 0
-                continue
-            
-            # Get all entries up to and including this one
-            previous_entries = self.search([
-                ('project_house_id', '=', entry.project_house_id.id),
-                '|',
-                ('date', '<', entry.date),
-                '&',
-                ('date', '=', entry.date),
-                ('id', '<=', entry.id),
-            ])
-            
-            entry.cumulative_harvested = sum(previous_entries.mapped('quantity'))
-            entry.cumulative_allocated = sum(previous_entries.mapped('allocated_cost'))
             
             if entry.expected_qty:
                 entry.cumulative_progress = (entry.cumulative_harvested / entry.expected_qty) * 100
             else:
                 entry.cumulative_progress = 0
 
+    def _get_cumulative_values(self):
+        """
+        Return {entry_id: (cumulative_harvested, cumulative_allocated)} for
+        this recordset, summing every entry of the same house up to and
+        including each entry in (date, id) order with a SQL window.
+        """
+        if not self.ids:
+            return {}
+        
+        self.flush_model(['project_house_id', 'date', 'quantity', 'allocated_cost'])
+        self.env.cr.execute("""
+            SELECT id, cumulative_harvested, cumulative_allocated
+              FROM (
+                    SELECT id,
+                           SUM(quantity) OVER w AS cumulative_harvested,
+                           SUM(COALESCE(allocated_cost, 0)) OVER w AS cumulative_allocated
+                      FROM farm_harvest_entry
+                     WHERE project_house_id IN (
+                            SELECT project_house_id FROM farm_harvest_entry WHERE id IN %s
+                           )
+                    WINDOW w AS (
+                        PARTITION BY project_house_id
+                        ORDER BY date, id
+                        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                    )
+                   ) AS running
+             WHERE id IN %s
+        """, [tuple(self.ids), tuple(self.ids)])
+        return {
+            entry_id: (harvested or 0.0, float(allocated or 0.0))
+            for entry_id, harvested, allocated in self.env.cr.fetchall()
+        }
+
     def _calculate_cost_allocation(self):
         """
         Calculate cost allocation for this harvest entry.
         Formula: allocated_cost = remaining_cost * (quantity / expected_qty)
+        The whole sequence of the entry's house is recalculated, since every
+        later entry depends on the cost allocated to the earlier ones.
         """
-        self.ensure_one()
+        self._recalculate_cost_allocation(self.mapped('project_house_id'))
+
+    @api.model
+    def _recalculate_cost_allocation(self, project_houses):
+        """
+        Recalculate cost allocation for all harvest entries of the given
+        project houses in a single pass.
+
+        Entries are loaded once ordered by (date, id); the remaining cost and
+        the cumulative totals are carried forward in memory and written back
+        with one UPDATE statement.
+
+        Monetary values are rounded to the entry currency, as the ORM would
+        store them, and the remaining cost is carried forward from the rounded
+        allocations. The entry that completes the expected quantity takes the
+        whole remaining cost, so the allocations sum to the house cost.
+        """
+        project_houses = project_houses.exists()
+        if not project_houses:
+            return
+        
+        # Make sure pending ORM writes are in the database before reading/updating
+        self.flush_model()
         
-        if not self.expected_qty:
-            self.remaining_cost_before = 0
-            self.allocated_cost = 0
+        entries = self.search(
+            [('project_house_id', 'in', project_houses.ids)],
+            order='project_house_id, date, id',
+        )
+        if not entries:
             return
         
-        # Get total house cost from cost allocations
-        allocations = self.env['farm.cost.allocation'].search([
-            ('project_id', '=', self.project_id.id),
-            ('house_id', '=', self.house_id.id),
-            ('cost_state', '=', 'posted'),
-        ])
-        total_house_cost = sum(allocations.mapped('allocated_amount'))
-        
-        # Get previously allocated cost (entries before this one)
-        previous_entries = self.search([
-            ('project_house_id', '=', self.project_house_id.id),
-            ('id', '!=', self.id),
-            '|',
-            ('date', '<', self.date),
-            '&',
-            ('date', '=', self.date),
-            ('id', '<', self.id),
-        ])
-        previous_allocated = sum(previous_entries.mapped('allocated_cost'))
-        
-        # Calculate remaining cost before this entry
-        remaining_cost = total_house_cost - previous_allocated
-        self.remaining_cost_before = remaining_cost
-        
-        # Calculate allocation for this entry
-        # allocated_cost = remaining_cost * (quantity / expected_qty)
-        entry_ratio = self.quantity / self.expected_qty
-        self.allocated_cost = remaining_cost * entry_ratio
-
-    def _recalculate_subsequent_entries(self):
-        """Recalculate all entries after this one"""
-        self.ensure_one()
+        # Total posted cost per (project, house) in one grouped query
+        house_costs = self.env['farm.cost.allocation']._get_house_cost_totals(project_houses)
+        
+        rows = []
+        entries_by_house = defaultdict(list)
+        for entry in entries:
+            entries_by_house[entry.project_house_id].append(entry)
         
-        subsequent_entries = self.search([
-            ('project_house_id', '=', self.project_house_id.id),
-            '|',
-            ('date', '>', self.date),
-            '&',
-            ('date', '=', self.date),
-            ('id', '>', self.id),
-        ], order='date, id')
+        for project_house, house_entries in entries_by_house.items():
+            expected_qty = project_house.expected_qty
+            total_house_cost = house_costs.get((project_house.project_id.id, project_house.house_id.id), 0.0)
+            cumulative_harvested = 0.0
+            cumulative_allocated = 0.0
+            
+            for entry in house_entries:
+                currency = entry.currency_id or self.env.company.currency_id
+                if expected_qty:
+                    remaining_cost = currency.round(total_house_cost - cumulative_allocated)
+                    if cumulative_harvested + entry.quantity >= expected_qty:
+                        allocated_cost = remaining_cost
+                    else:
+                        allocated_cost = currency.round(remaining_cost * (entry.quantity / expected_qty))
+                else:
+                    remaining_cost = 0.0
+                    allocated_cost = 0.0
+                
+                cumulative_harvested += entry.quantity
+                cumulative_allocated = currency.round(cumulative_allocated + allocated_cost)
+                cumulative_progress = (cumulative_harvested / expected_qty) * 100 if expected_qty else 0.0
+                unit_cost = currency.round(allocated_cost / entry.quantity) if entry.quantity else 0.0
+                
+                rows.append((
+                    entry.id, remaining_cost, allocated_cost, unit_cost,
+                    cumulative_harvested, cumulative_allocated, cumulative_progress,
+                ))
         
-        for entry in subsequent_entries:
-            entry._calculate_cost_allocation()
+        self._write_cost_allocation(rows)
+
+    def _write_cost_allocation(self, rows):
+        """
+        Write computed allocation values back in bulk.
+        rows: list of (id, remaining_cost_before, allocated_cost, unit_cost,
+        cumulative_harvested, cumulative_allocated, cumulative_progress)
+        """
+        if not rows:
+            return
+        
+        columns = list(zip(*rows))
+        self.env.cr.execute("""
+            UPDATE farm_harvest_entry AS entry
+               SET remaining_cost_before = v.remaining_cost_before,
+                   allocated_cost = v.allocated_cost,
+                   unit_cost = v.unit_cost,
+                   cumulative_harvested = v.cumulative_harvested,
+                   cumulative_allocated = v.cumulative_allocated,
+                   cumulative_progress = v.cumulative_progress
+              FROM unnest(%s::int[], %s::numeric[], %s::numeric[], %s::numeric[],
+                          %s::float8[], %s::numeric[], %s::float8[])
+                   AS v(id, remaining_cost_before, allocated_cost, unit_cost,
+                        cumulative_harvested, cumulative_allocated, cumulative_progress)
+             WHERE entry.id = v.id
+        """, [list(column) for column in columns])
+        
+        entries = self.browse(columns[0])
+        fnames = [
+            'remaining_cost_before', 'allocated_cost', 'unit_cost',
+            'cumulative_harvested', 'cumulative_allocated', 'cumulative_progress',
+        ]
+        entries.invalidate_recordset(fnames)
+        # Values of these entries are final: only notify dependent records
+        # (e.g. project house cost stats), do not recompute the entries themselves
+        with self.env.protecting([self._fields[fname] for fname in fnames], entries):
+            entries.modified(fnames)
 
     @api.constrains('quantity')
     def _check_quantity(self):
@@ -562,8 +641,13 @@ class FarmHarvestEntry(models.Model):
 
     def action_recalculate_cost(self):
         """Manual action to recalculate cost allocation"""
-        for entry in self:
-            entry._calculate_cost_allocation()
+        project_houses = self.mapped('project_house_id')
+        if self.env['farm.job']._should_defer(len(project_houses)):
+            return self.env['farm.job']._enqueue(
+                _('إعادة احتساب تكلفة الحصاد'), 'farm.project.house', '_recalculate_harvest_costs',
+                project_houses.ids, chunk_size=50,
+            )._notify_enqueued()
+        self._calculate_cost_allocation()
         return True
 
     def action_create_stock_move(self):
@@ -697,3 +781,96 @@ class FarmHarvestEntry(models.Model):
         
         return True
 
+
+
+class FarmHarvestRecalcQueue(models.Model):
+    _name = 'farm.harvest.recalc.queue'
+    _description = 'قائمة انتظار إعادة احتساب تكلفة الحصاد'
+    _order = 'id'
+
+    project_house_id = fields.Many2one(
+        'farm.project.house',
+        string='تخصيص البيت',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    project_id = fields.Many2one(
+        related='project_house_id.project_id',
+        string='المشروع',
+        store=True,
+    )
+    house_id = fields.Many2one(
+        related='project_house_id.house_id',
+        string='البيت',
+        store=True,
+    )
+
+    _sql_constraints = [
+        ('unique_project_house', 'UNIQUE(project_house_id)',
+         'تخصيص البيت موجود بالفعل في قائمة الانتظار!')
+    ]
+
+    @api.model
+    def _enqueue(self, project_houses):
+        """
+        Mark project houses for harvest re-costing.
+        Houses are collected and each one is processed once, when the caller
+        runs _flush_pending (cost posting and cancelling do) or, as a safety
+        net, right before commit.
+        """
+        if not project_houses:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get('farm.harvest.recalc')
+        if pending is None:
+            pending = data['farm.harvest.recalc'] = set()
+            self.env.cr.precommit.add(self._flush_pending)
+        pending.update(project_houses.ids)
+
+    @api.model
+    def _flush_pending(self):
+        """Process the project houses collected so far in the transaction"""
+        ids = self.env.cr.precommit.data.pop('farm.harvest.recalc', set())
+        project_houses = self.env['farm.project.house'].browse(ids).exists()
+        if not project_houses:
+            return
+        
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.harvest_recalc_async_threshold', default=50
+        ) or 0)
+        if threshold and len(project_houses) > threshold:
+            # Large batch: hand it to the cron instead of delaying the commit
+            self._push(project_houses)
+        else:
+            self.env['farm.harvest.entry']._recalculate_cost_allocation(project_houses)
+        self.env.flush_all()
+
+    @api.model
+    def _push(self, project_houses):
+        """Store project houses in the queue table and wake up the cron"""
+        queued = self.sudo().search([('project_house_id', 'in', project_houses.ids)])
+        missing = project_houses - queued.mapped('project_house_id')
+        self.sudo().create([{'project_house_id': ph.id} for ph in missing])
+        cron = self.env.ref('farm_management.ir_cron_farm_harvest_recalc', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _get_pending_count(self):
+        """Number of project houses waiting for harvest re-costing"""
+        return self.sudo().search_count([])
+
+    @api.model
+    def _cron_process_queue(self, batch_size=200):
+        """Re-cost queued project houses in batches, committing between batches"""
+        while True:
+            items = self.search([], limit=batch_size)
+            if not items:
+                break
+            project_houses = items.mapped('project_house_id')
+            items.unlink()
+            self.env['farm.harvest.entry']._recalculate_cost_allocation(project_houses)
+            self.env.flush_all()
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
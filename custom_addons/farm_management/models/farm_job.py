@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+class FarmJob(models.Model):
+    """
+    Background job for long farm operations (project completion, imports,
+    mass posting, recalculations).
+
+    A job calls `method` on `res_model` for its items, `chunk_size` items at a
+    time, from the cron. Each chunk is committed with the job checkpoint
+    (`offset`), so a job killed by a worker restart resumes from the last
+    committed chunk instead of starting over.
+    """
+    _name = 'farm.job'
+    _description = 'مهمة خلفية للمزارع'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='المهمة',
+        required=True,
+        readonly=True,
+    )
+    state = fields.Selection([
+        ('pending', 'في الانتظار'),
+        ('running', 'قيد التنفيذ'),
+        ('done', 'منتهية'),
+        ('failed', 'فشلت'),
+        ('cancelled', 'ملغاة'),
+    ], string='الحالة', default='pending', required=True, readonly=True, index=True)
+
+    # What to run
+    res_model = fields.Char(
+        string='النموذج',
+        required=True,
+        readonly=True,
+    )
+    method = fields.Char(
+        string='الدالة',
+        required=True,
+        readonly=True,
+    )
+    pass_records = fields.Boolean(
+        string='البنود سجلات',
+        default=True,
+        readonly=True,
+        help='إذا كان مفعلاً، البنود هي معرفات سجلات ويتم استدعاء الدالة على السجلات. '
+             'وإلا يتم تمرير البنود كقائمة إلى الدالة على مستوى النموذج.',
+    )
+    items = fields.Json(
+        string='البنود',
+        readonly=True,
+    )
+    kwargs = fields.Json(
+        string='المعاملات',
+        readonly=True,
+    )
+    chunk_size = fields.Integer(
+        string='حجم الدفعة',
+        default=100,
+        readonly=True,
+    )
+
+    # Checkpoint and progress
+    offset = fields.Integer(
+        string='البنود المعالجة',
+        default=0,
+        readonly=True,
+    )
+    total_count = fields.Integer(
+        string='إجمالي البنود',
+        readonly=True,
+    )
+    progress = fields.Float(
+        string='التقدم (%)',
+        compute='_compute_progress',
+    )
+
+    user_id = fields.Many2one(
+        'res.users',
+        string='المستخدم',
+        default=lambda self: self.env.user,
+        required=True,
+        readonly=True,
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='الشركة',
+        default=lambda self: self.env.company,
+        readonly=True,
+    )
+    date_started = fields.Datetime(
+        string='تاريخ البدء',
+        readonly=True,
+    )
+    date_done = fields.Datetime(
+        string='تاريخ الانتهاء',
+        readonly=True,
+    )
+    log = fields.Text(
+        string='السجل',
+        readonly=True,
+    )
+    error_message = fields.Text(
+        string='الخطأ',
+        readonly=True,
+    )
+
+    @api.depends('offset', 'total_count', 'state')
+    def _compute_progress(self):
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job.total_count:
+                job.progress = min(job.offset / job.total_count * 100, 100.0)
+            else:
+                job.progress = 0.0
+
+    # ========== Hand-off API ==========
+
+    @api.model
+    def _should_defer(self, count):
+        """
+        True when an action working on `count` items should hand its work to
+        a job instead of running inside the request. Never defers from
+        inside a running job.
+        """
+        if self.env.context.get('farm_job_id'):
+            return False
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.job_threshold', default=100
+        ) or 0)
+        return bool(threshold) and count > threshold
+
+    @api.model
+    def _enqueue(self, name, res_model, method, items, kwargs=None, pass_records=True, chunk_size=100,
+                 coalesce=False):
+        """
+        Create a job and wake up the cron.
+
+        :param items: record ids (pass_records=True) or JSON-serialisable items
+        :param kwargs: extra keyword arguments passed to the method
+        :param coalesce: add the items to a job of the same method, user and
+            company that has not started yet, instead of creating a new one
+        """
+        items = list(items)
+        if coalesce:
+            job = self._find_pending_job(res_model, method, kwargs or {})
+            if job:
+                queued = set(map(repr, job.items or []))
+                new_items = [item for item in items if repr(item) not in queued]
+                if new_items:
+                    job.sudo().write({
+                        'items': (job.items or []) + new_items,
+                        'total_count': job.total_count + len(new_items),
+                    })
+                job._trigger_cron()
+                return job
+        job = self.sudo().create({
+            'name': name,
+            'res_model': res_model,
+            'method': method,
+            'pass_records': pass_records,
+            'items': items,
+            'kwargs': kwargs or {},
+            'chunk_size': chunk_size,
+            'total_count': len(items),
+            'user_id': self.env.user.id,
+            'company_id': self.env.company.id,
+        })
+        job._trigger_cron()
+        return job
+
+    @api.model
+    def _find_pending_job(self, res_model, method, kwargs):
+        """
+        Lock and return a job of this method that has not started yet, or an
+        empty recordset. Jobs locked by the runner are skipped.
+        """
+        self.env.cr.execute("""
+            SELECT id, kwargs FROM farm_job
+             WHERE state = 'pending' AND "offset" = 0
+               AND res_model = %s AND method = %s
+               AND user_id = %s AND company_id = %s
+             ORDER BY id DESC
+               FOR UPDATE SKIP LOCKED
+        """, [res_model, method, self.env.uid, self.env.company.id])
+        for job_id, job_kwargs in self.env.cr.fetchall():
+            if (job_kwargs or {}) == kwargs:
+                job = self.browse(job_id)
+                job.invalidate_recordset()
+                return job
+        return self.browse()
+
+    def _notify_enqueued(self):
+        """Client action telling the user the work continues in the background"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('مهمة في الخلفية'),
+                'message': _('تمت جدولة "%s" (%s بند) للتنفيذ في الخلفية. يمكنك متابعة التقدم من قائمة المهام الخلفية.') % (
+                    self.name, self.total_count),
+                'type': 'info',
+                'sticky': False,
+            },
+        }
+
+    @api.model
+    def _trigger_cron(self):
+        cron = self.env.ref('farm_management.ir_cron_farm_job', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    # ========== Actions ==========
+
+    def action_retry(self):
+        """Resume failed or cancelled jobs from their last checkpoint"""
+        jobs = self.filtered(lambda j: j.state in ('failed', 'cancelled'))
+        if not jobs:
+            raise UserError(_('يمكن إعادة تشغيل المهام الفاشلة أو الملغاة فقط'))
+        jobs.sudo().write({'state': 'pending', 'error_message': False})
+        self._trigger_cron()
+        return True
+
+    def action_cancel(self):
+        """Stop jobs; chunks already committed are kept"""
+        self.filtered(lambda j: j.state in ('pending', 'running', 'failed')).sudo().write({
+            'state': 'cancelled',
+        })
+        return True
+
+    @api.autovacuum
+    def _gc_finished_jobs(self):
+        """Delete finished, failed and cancelled jobs older than the retention period"""
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.job_retention_days', default=30
+        ) or 0)
+        if days <= 0:
+            return
+        limit_date = fields.Datetime.now() - timedelta(days=days)
+        jobs = self.sudo().search([
+            ('state', 'in', ('done', 'failed', 'cancelled')),
+            ('write_date', '<', limit_date),
+        ])
+        jobs.unlink()
+        _logger.info("Farm jobs: deleted %s finished jobs older than %s days", len(jobs), days)
+
+    # ========== Runner ==========
+
+    @api.model
+    def _get_time_budget(self):
+        """Seconds a cron run may spend before handing over to the next run"""
+        limit = config.get('limit_time_real_cron') or -1
+        if limit <= 0:
+            limit = config.get('limit_time_real') or 120
+        # Keep a margin for the chunk in progress
+        return limit * 0.6
+
+    @api.model
+    def _cron_run_jobs(self):
+        """Run pending jobs chunk by chunk, committing after each chunk"""
+        deadline = time.monotonic() + self._get_time_budget()
+        while time.monotonic() < deadline:
+            # Lock the next job; another worker running it would hold the lock
+            self.env.cr.execute("""
+                SELECT id FROM farm_job
+                 WHERE state IN ('pending', 'running')
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            job = self.browse(row[0])
+            job._run_chunk()
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+        # Out of time with work left: continue in a new cron run
+        self._trigger_cron()
+
+    def _run_chunk(self):
+        """Process the next chunk of the job and move its checkpoint"""
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'date_started': self.date_started or fields.Datetime.now()})
+
+        items = self.items or []
+        chunk = items[self.offset:self.offset + max(self.chunk_size, 1)]
+        if chunk:
+            env = self.env(
+                user=self.user_id,
+                context=dict(
+                    self.env.context,
+                    farm_job_id=self.id,
+                    allowed_company_ids=self.company_id.ids or self.user_id.company_ids.ids,
+                ),
+            )
+            target = env[self.res_model]
+            try:
+                with self.env.cr.savepoint():
+                    if self.pass_records:
+                        result = getattr(target.browse(chunk).exists(), self.method)(**(self.kwargs or {}))
+                    else:
+                        result = getattr(target, self.method)(chunk, **(self.kwargs or {}))
+                    env.flush_all()
+            except Exception:
+                _logger.exception("Farm job %s (%s) failed at offset %s", self.id, self.name, self.offset)
+                self.write({
+                    'state': 'failed',
+                    'error_message': traceback.format_exc(),
+                })
+                return
+
+            vals = {'offset': self.offset + len(chunk)}
+            if isinstance(result, str) and result:
+                vals['log'] = '\n'.join(filter(None, [self.log, result]))
+            self.write(vals)
+
+        if self.offset >= len(items):
+            self.write({'state': 'done', 'date_done': fields.Datetime.now()})
@@ -234,16 +234,10 @@ class FarmProductOrder(models.Model):
         if self.target_house_ids:
             target_houses |= self.target_house_ids
         
-        # Add houses from selected units
-        if self.target_unit_ids:
-            for unit in self.target_unit_ids:
-                target_houses |= unit.house_ids
-        
-        # Add houses from selected sectors
-        if self.target_sector_ids:
-            for sector in self.target_sector_ids:
-                for unit in sector.unit_ids:
-                    target_houses |= unit.house_ids
+        # Add houses from selected sectors and units (one indexed subtree search)
+        target_houses |= self.env['farm.house']._get_subtree_houses(
+            sectors=self.target_sector_ids._origin, units=self.target_unit_ids._origin,
+        )
         
         return target_houses
 
@@ -553,10 +547,10 @@ class FarmProductOrder(models.Model):
             self.message_post(body=_('لم يتم العثور على حسابات مصدر للمنتجات. لم يتم إنشاء تكاليف.'))
             return
         
-        # Create one cost per unique source account
-        created_costs = []
+        # Create one cost per unique source account, posted in one call
+        cost_vals_list = []
         for account_data in account_groups.values():
-            cost_vals = {
+            cost_vals_list.append({
                 'project_id': project.id,
                 'cost_type': 'direct',
                 'amount': account_data['amount'],
@@ -565,11 +559,9 @@ class FarmProductOrder(models.Model):
                 'direct_cost_account_id': account_data['account'].id,
                 'source_house_ids': [(6, 0, target_houses.ids)],
                 'order_id': self.id,
-            }
-            
-            cost = self.env['farm.project.cost'].create(cost_vals)
-            cost.action_post()
-            created_costs.append(cost)
+            })
+        
+        created_costs = self.env['farm.project.cost']._create_and_post(cost_vals_list)
         
         if created_costs:
             self.message_post(body=_('تم إنشاء %s تكلفة/تكاليف مباشرة') % len(created_costs))
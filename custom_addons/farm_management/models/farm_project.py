@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import re
+from collections import defaultdict
+
+from markupsafe import Markup
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 from datetime import date
 
+# Products per chunk of a background AVCO update
+AVCO_JOB_PRODUCTS = 20
+
 
 class FarmProject(models.Model):
     _name = 'farm.project'
@@ -135,21 +142,25 @@ class FarmProject(models.Model):
     total_direct_cost = fields.Monetary(
         string='إجمالي التكاليف المباشرة',
         compute='_compute_costs',
+        store=True,
         currency_field='currency_id',
     )
     total_indirect_cost = fields.Monetary(
         string='إجمالي التكاليف غير المباشرة',
         compute='_compute_costs',
+        store=True,
         currency_field='currency_id',
     )
     total_cost = fields.Monetary(
         string='إجمالي التكاليف',
         compute='_compute_costs',
+        store=True,
         currency_field='currency_id',
     )
     cost_per_sqm = fields.Monetary(
         string='التكلفة لكل م²',
         compute='_compute_costs',
+        store=True,
         currency_field='currency_id',
     )
     progress_days = fields.Integer(
@@ -168,6 +179,35 @@ class FarmProject(models.Model):
                 vals['code'] = self.env['ir.sequence'].next_by_code('farm.project') or 'جديد'
         return super().create(vals_list)
 
+    @api.model
+    def _count_projects_by(self, field_name, ids):
+        """
+        Count the projects of many hierarchy records with one grouped query.
+        Sector, unit and house projects are those with a house assigned
+        under the record.
+
+        :param field_name: 'farm_id', 'sector_id', 'unit_id' or 'house_id'
+        :return: {record_id: {status: count}}
+        """
+        counts = defaultdict(dict)
+        if not ids:
+            return counts
+        if field_name == 'farm_id':
+            groups = self._read_group(
+                [('farm_id', 'in', ids)],
+                ['farm_id', 'status'],
+                ['__count'],
+            )
+        else:
+            groups = self.env['farm.project.house']._read_group(
+                [(field_name, 'in', ids)],
+                [field_name, 'project_status'],
+                ['project_id:count_distinct'],
+            )
+        for record, status, count in groups:
+            counts[record.id][status] = count
+        return counts
+
     @api.depends('house_assignment_ids')
     def _compute_house_count(self):
         for project in self:
@@ -182,13 +222,21 @@ class FarmProject(models.Model):
 
     @api.depends('cost_ids', 'cost_ids.amount', 'cost_ids.cost_type', 'cost_ids.state', 'total_area')
     def _compute_costs(self):
+        # Only count posted costs (harvest costs are direct costs and included in calculations),
+        # summed for all projects with one grouped query
+        totals = defaultdict(float)
+        if self._origin.ids:
+            groups = self.env['farm.project.cost']._read_group(
+                [('project_id', 'in', self._origin.ids), ('state', '=', 'posted')],
+                ['project_id', 'cost_type'],
+                ['amount:sum'],
+            )
+            for project, cost_type, amount in groups:
+                totals[(project.id, cost_type)] = amount
+        
         for project in self:
-            # Only count posted costs (harvest costs are direct costs and included in calculations)
-            posted_costs = project.cost_ids.filtered(lambda c: c.state == 'posted')
-            direct_costs = posted_costs.filtered(lambda c: c.cost_type == 'direct')
-            indirect_costs = posted_costs.filtered(lambda c: c.cost_type == 'indirect')
-            project.total_direct_cost = sum(direct_costs.mapped('amount'))
-            project.total_indirect_cost = sum(indirect_costs.mapped('amount'))
+            project.total_direct_cost = totals[(project._origin.id, 'direct')]
+            project.total_indirect_cost = totals[(project._origin.id, 'indirect')]
             project.total_cost = project.total_direct_cost + project.total_indirect_cost
             project.cost_per_sqm = project.total_cost / project.total_area if project.total_area else 0
 
@@ -211,6 +259,32 @@ class FarmProject(models.Model):
         for project in self:
             project.landed_cost_count = len(project.landed_cost_ids)
 
+    def _get_weight_version(self):
+        """
+        Return the current area-weight version of the project (used by compact
+        cost allocation), creating a new version when the houses or their
+        areas changed since the last one.
+        """
+        self.ensure_one()
+        houses = self.house_assignment_ids.mapped('house_id').sorted('id')
+        weights = houses.mapped('area')
+        if sum(weights) <= 0:
+            # Equal distribution if no area
+            weights = [1.0] * len(houses)
+        vector = list(zip(houses.ids, weights))
+        
+        last_version = self.env['farm.project.weight.version'].search([
+            ('project_id', '=', self.id),
+        ], order='id desc', limit=1)
+        if last_version and last_version._get_vector() == vector:
+            return last_version
+        
+        return self.env['farm.project.weight.version'].create({
+            'project_id': self.id,
+            'total_weight': sum(weights),
+            'line_ids': [(0, 0, {'house_id': house_id, 'weight': weight}) for house_id, weight in vector],
+        })
+
     # ========== Status Actions ==========
     
     def action_start(self):
@@ -272,7 +346,9 @@ class FarmProject(models.Model):
             'status': 'completed',
             'actual_finish_date': date.today(),
         })
-        # Auto-update product AVCO on completion
+        # Auto-update product AVCO on completion (in the background for large projects)
+        if self.env['farm.job']._should_defer(len(self.house_assignment_ids)):
+            return self._enqueue_avco_update()._notify_enqueued()
         self._update_product_avco()
 
     def action_cancel(self):
@@ -355,8 +431,35 @@ class FarmProject(models.Model):
         self.ensure_one()
         if self.status not in ('in_progress', 'completed'):
             raise UserError(_('يمكن تحديث AVCO فقط للمشاريع قيد التنفيذ أو المكتملة'))
-        self._revert_avco()
-        self._update_product_avco()
+        if self.env['farm.job']._should_defer(len(self.house_assignment_ids)):
+            # Reverting only touches the project's landed costs and products
+            self._revert_avco()
+            return self._enqueue_avco_update()._notify_enqueued()
+        self._recompute_avco()
+
+    def _enqueue_avco_update(self):
+        """
+        Hand the AVCO update to a background job working on the project's
+        products, AVCO_JOB_PRODUCTS at a time. The houses of a product stay
+        in one chunk, since its AVCO is weighted over all of them.
+        """
+        self.ensure_one()
+        return self.env['farm.job']._enqueue(
+            _('تحديث AVCO - %s') % self.name, 'farm.project', '_update_products_avco',
+            sorted(set(self.house_assignment_ids.product_id.ids)),
+            kwargs={'project_id': self.id}, pass_records=False, chunk_size=AVCO_JOB_PRODUCTS,
+        )
+
+    @api.model
+    def _update_products_avco(self, product_ids, project_id):
+        """Job entry point: update the AVCO of a group of the project's products"""
+        self.browse(project_id).exists()._update_product_avco(product_ids=product_ids)
+
+    def _recompute_avco(self):
+        """Revert the previous AVCO update and compute it again"""
+        for project in self:
+            project._revert_avco()
+            project._update_product_avco()
 
     def _revert_avco(self):
         """Cancel and remove all landed costs created by this project, then reset product AVCO."""
@@ -396,13 +499,26 @@ class FarmProject(models.Model):
         
         self.avco_updated = False
 
-    def _update_product_avco(self):
+    def _update_product_avco(self, product_ids=None):
         """Compute AVCO for each house's product: total_real_costs / total_harvested_qty.
         
         Simple approach: directly set the product's standard_price and create
         a landed cost record for audit trail only.
+        
+        Set-based: allocation totals and harvested quantities are read with one
+        grouped query each, houses sharing a product are weighted together, the
+        valuation layers are updated with one statement, and one landed cost
+        (one line per house) and one summary message are created for the project.
+
+        With `product_ids`, only the houses growing these products are
+        updated (one chunk of a background AVCO update).
         """
         self.ensure_one()
+        # Harvest allocations queued by this transaction must be up to date
+        self.env['farm.harvest.recalc.queue']._flush_pending()
+        house_assignments = self.house_assignment_ids
+        if product_ids is not None:
+            house_assignments = house_assignments.filtered(lambda h: h.product_id.id in product_ids)
 
         # Get the cost service product for landed cost lines
         cost_product = self.env.ref('farm_management.product_post_harvest_cost', raise_if_not_found=False)
@@ -418,99 +534,150 @@ class FarmProject(models.Model):
         if not journal:
             raise UserError(_('لم يتم العثور على دفتر يومية عام.'))
 
-        created_count = 0
-        for house_assign in self.house_assignment_ids:
-            house = house_assign.house_id
-
-            # Sum REAL allocated costs (exclude harvest-created costs to avoid double counting)
-            allocations = self.env['farm.cost.allocation'].search([
-                ('cost_id.project_id', '=', self.id),
-                ('house_id', '=', house.id),
-                ('cost_id.state', '=', 'posted'),
-                ('cost_id.harvest_entry_id', '=', False),
-            ])
-            total_allocated = sum(allocations.mapped('allocated_amount'))
-            if total_allocated <= 0:
-                continue
+        # Sum REAL allocated costs per house (exclude harvest-created costs to avoid double counting)
+        allocation_groups = self.env['farm.cost.allocation.report']._read_group(
+            [
+                ('project_id', '=', self.id),
+                ('house_id', 'in', house_assignments.house_id.ids),
+                ('cost_state', '=', 'posted'),
+                ('is_harvest_cost', '=', False),
+            ],
+            ['house_id'],
+            ['allocated_amount:sum', 'cost_id:array_agg'],
+        )
+        house_costs = {
+            house.id: (amount, cost_ids)
+            for house, amount, cost_ids in allocation_groups
+        }
 
-            # Find harvest entries for this house
-            harvest_entries = self.env['farm.harvest.entry'].search([
-                ('project_house_id.project_id', '=', self.id),
-                ('project_house_id.house_id', '=', house.id),
+        # Harvested quantity and pickings per house assignment
+        harvest_groups = self.env['farm.harvest.entry']._read_group(
+            [
+                ('project_house_id', 'in', house_assignments.ids),
                 ('state', '=', 'done'),
                 ('picking_id', '!=', False),
-            ])
-            if not harvest_entries:
-                continue
+            ],
+            ['project_house_id'],
+            ['quantity:sum', 'picking_id:array_agg'],
+        )
+        house_harvests = {
+            project_house.id: (quantity, picking_ids)
+            for project_house, quantity, picking_ids in harvest_groups
+        }
 
-            picking_ids = harvest_entries.mapped('picking_id')
-            product = house_assign.product_id
-            if not product:
+        # Prefetch all costs used to pick the cost accounts
+        all_cost_ids = {cost_id for _amount, cost_ids in house_costs.values() for cost_id in cost_ids}
+        self.env['farm.project.cost'].browse(all_cost_ids).mapped('direct_cost_account_id')
+        default_cost_account = cost_product.property_account_expense_id or \
+                               cost_product.categ_id.property_account_expense_categ_id
+
+        house_results = []
+        for house_assign in house_assignments:
+            house = house_assign.house_id
+            total_allocated, cost_ids = house_costs.get(house.id, (0.0, []))
+            if total_allocated <= 0:
                 continue
 
             # Get total harvested quantity
-            total_qty = sum(harvest_entries.mapped('quantity'))
-            if total_qty <= 0:
+            total_qty, picking_ids = house_harvests.get(house_assign.id, (0.0, []))
+            product = house_assign.product_id
+            if not picking_ids or not product or total_qty <= 0:
                 continue
 
-            # Compute the target AVCO: total real costs / total harvested qty
-            target_avco = total_allocated / total_qty
-
-            # Determine cost account
+            # Determine cost account (most recent cost first)
             cost_account = False
-            for alloc in allocations:
-                if alloc.cost_id.direct_cost_account_id:
-                    cost_account = alloc.cost_id.direct_cost_account_id
+            for cost in self.env['farm.project.cost'].browse(sorted(set(cost_ids), reverse=True)):
+                cost_account = cost.direct_cost_account_id or cost.indirect_cost_account_id
+                if cost_account:
                     break
-                if alloc.cost_id.indirect_cost_account_id:
-                    cost_account = alloc.cost_id.indirect_cost_account_id
-                    break
-            if not cost_account:
-                cost_account = cost_product.property_account_expense_id or \
-                               cost_product.categ_id.property_account_expense_categ_id
+            cost_account = cost_account or default_cost_account
             if not cost_account:
                 continue
 
-            # Directly set the product's standard_price (AVCO)
+            house_results.append({
+                'house': house,
+                'product': product,
+                'total_allocated': total_allocated,
+                'total_qty': total_qty,
+                'picking_ids': picking_ids,
+                'cost_account': cost_account,
+            })
+
+        if not house_results:
+            self.avco_updated = True
+            if product_ids is None:
+                self.message_post(body=_('لم يتم العثور على بيوت بها تكاليف موزعة وسجلات حصاد لتحديث AVCO'))
+            return
+
+        # Target AVCO per product: houses of the same product are weighted by quantity
+        product_totals = defaultdict(lambda: [0.0, 0.0])
+        for result in house_results:
+            product_totals[result['product']][0] += result['total_allocated']
+            product_totals[result['product']][1] += result['total_qty']
+        product_avco = {
+            product: total_allocated / total_qty
+            for product, (total_allocated, total_qty) in product_totals.items()
+        }
+
+        # Directly set the products' standard_price (AVCO)
+        for product, target_avco in product_avco.items():
             product.sudo().with_context(disable_auto_svl=True).standard_price = target_avco
 
-            # Update the SVL remaining_value to match the new AVCO
-            # so that Odoo's internal valuation stays consistent
-            layers = self.env['stock.valuation.layer'].sudo().search([
-                ('product_id', '=', product.id),
-                ('remaining_qty', '>', 0),
-            ])
-            for layer in layers:
-                layer.remaining_value = layer.remaining_qty * target_avco
-
-            # Create a landed cost record for audit trail
-            landed_cost = self.env['stock.landed.cost'].create({
-                'date': fields.Date.today(),
-                'account_journal_id': journal.id,
-                'picking_ids': [(6, 0, picking_ids.ids)],
-                'farm_project_id': self.id,
-                'cost_lines': [(0, 0, {
-                    'name': _('تكاليف المشروع - %s - بيت %s (AVCO: %s)') % (
-                        self.name, house.name, round(target_avco, 2)),
-                    'product_id': cost_product.id,
-                    'price_unit': total_allocated,
-                    'split_method': 'by_quantity',
-                    'account_id': cost_account.id,
-                })],
-            })
-            # Mark as done for audit (don't validate via Odoo - we set AVCO directly)
-            landed_cost.sudo().write({'state': 'done'})
-            created_count += 1
+        # Update the SVL remaining_value to match the new AVCO in one statement,
+        # so that Odoo's internal valuation stays consistent
+        self._update_valuation_layers(product_avco)
 
-            self.message_post(body=_(
-                'بيت %s: AVCO = %s (%s تكاليف حقيقية / %s كمية محصودة)'
-            ) % (house.name, round(target_avco, 2), round(total_allocated, 2), round(total_qty, 2)))
+        # Create one landed cost record for the project for audit trail
+        picking_ids = sorted({picking_id for result in house_results for picking_id in result['picking_ids']})
+        landed_cost = self.env['stock.landed.cost'].create({
+            'date': fields.Date.today(),
+            'account_journal_id': journal.id,
+            'picking_ids': [(6, 0, picking_ids)],
+            'farm_project_id': self.id,
+            'cost_lines': [(0, 0, {
+                'name': _('تكاليف المشروع - %s - بيت %s (AVCO: %s)') % (
+                    self.name, result['house'].name, round(product_avco[result['product']], 2)),
+                'product_id': cost_product.id,
+                'price_unit': result['total_allocated'],
+                'split_method': 'by_quantity',
+                'account_id': result['cost_account'].id,
+            }) for result in house_results],
+        })
+        # Mark as done for audit (don't validate via Odoo - we set AVCO directly)
+        landed_cost.sudo().write({'state': 'done'})
 
         self.avco_updated = True
-        if created_count:
-            self.message_post(body=_('تم تحديث تكلفة المنتجات (AVCO) لـ %s بيت/بيوت') % created_count)
-        else:
-            self.message_post(body=_('لم يتم العثور على بيوت بها تكاليف موزعة وسجلات حصاد لتحديث AVCO'))
+        summary_lines = [
+            _('تم تحديث تكلفة المنتجات (AVCO) لـ %s بيت/بيوت') % len(house_results)
+        ] + [
+            _('بيت %s: AVCO = %s (%s تكاليف حقيقية / %s كمية محصودة)') % (
+                result['house'].name,
+                round(product_avco[result['product']], 2),
+                round(result['total_allocated'], 2),
+                round(result['total_qty'], 2),
+            )
+            for result in house_results
+        ]
+        self.message_post(body=Markup('<br/>').join(summary_lines))
+
+    def _update_valuation_layers(self, product_avco):
+        """Set remaining_value = remaining_qty * AVCO on the open layers of the given products"""
+        if not product_avco:
+            return
+        layer_model = self.env['stock.valuation.layer'].sudo()
+        layer_model.flush_model(['product_id', 'remaining_qty', 'remaining_value'])
+        self.env.cr.execute("""
+            UPDATE stock_valuation_layer svl
+               SET remaining_value = ROUND((svl.remaining_qty * avco.value)::numeric, %s)
+              FROM unnest(%s::int[], %s::float8[]) AS avco(product_id, value)
+             WHERE svl.product_id = avco.product_id
+               AND svl.remaining_qty > 0
+        """, (
+            self.company_id.currency_id.decimal_places,
+            [product.id for product in product_avco],
+            list(product_avco.values()),
+        ))
+        layer_model.invalidate_model(['remaining_value'])
 
     def action_view_landed_costs(self):
         """Open landed costs created by this project."""
@@ -647,6 +814,11 @@ class FarmProjectHouse(models.Model):
         string='المزرعة',
         store=True,
     )
+    project_status = fields.Selection(
+        related='project_id.status',
+        string='حالة المشروع',
+        store=True,
+    )
     company_id = fields.Many2one(
         related='project_id.company_id',
         string='الشركة',
@@ -762,7 +934,7 @@ class FarmProjectHouse(models.Model):
     def _compute_cost_stats(self):
         for record in self:
             # Get total house cost from cost allocations
-            allocations = self.env['farm.cost.allocation'].search([
+            allocations = self.env['farm.cost.allocation.report'].search([
                 ('project_id', '=', record.project_id.id),
                 ('house_id', '=', record.house_id.id),
                 ('cost_state', '=', 'posted'),
@@ -781,6 +953,10 @@ class FarmProjectHouse(models.Model):
             else:
                 record.avg_unit_cost = 0
 
+    def _recalculate_harvest_costs(self):
+        """Re-cost the harvest entries of these house assignments (background job step)"""
+        self.env['farm.harvest.entry']._recalculate_cost_allocation(self)
+
     def action_view_harvests(self):
         """View harvest entries for this house assignment"""
         self.ensure_one()
@@ -799,7 +975,7 @@ class FarmProjectHouse(models.Model):
         return {
             'type': 'ir.actions.act_window',
             'name': _('تكاليف البيت'),
-            'res_model': 'farm.cost.allocation',
+            'res_model': 'farm.cost.allocation.report',
             'view_mode': 'tree,pivot,graph',
             'domain': [
                 ('project_id', '=', self.project_id.id),
@@ -808,6 +984,57 @@ class FarmProjectHouse(models.Model):
         }
 
 
+class FarmProjectWeightVersion(models.Model):
+    _name = 'farm.project.weight.version'
+    _description = 'نسخة أوزان توزيع المشروع'
+    _order = 'project_id, id desc'
+
+    project_id = fields.Many2one(
+        'farm.project',
+        string='المشروع',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    line_ids = fields.One2many(
+        'farm.project.weight.line',
+        'version_id',
+        string='الأوزان',
+    )
+    total_weight = fields.Float(
+        string='إجمالي الوزن',
+    )
+
+    def _get_vector(self):
+        """Return the weights as [(house_id, weight)] ordered like they were created"""
+        self.ensure_one()
+        return [(line.house_id.id, line.weight) for line in self.line_ids.sorted('id')]
+
+
+class FarmProjectWeightLine(models.Model):
+    _name = 'farm.project.weight.line'
+    _description = 'وزن توزيع البيت'
+    _order = 'version_id, id'
+
+    version_id = fields.Many2one(
+        'farm.project.weight.version',
+        string='النسخة',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    house_id = fields.Many2one(
+        'farm.house',
+        string='البيت',
+        required=True,
+        ondelete='restrict',
+    )
+    weight = fields.Float(
+        string='الوزن',
+        help='مساحة البيت عند إنشاء النسخة',
+    )
+
+
 class FarmProjectStatusHistory(models.Model):
     _name = 'farm.project.status.history'
     _description = 'سجل حالات المشروع'
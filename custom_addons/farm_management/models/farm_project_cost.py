@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models, _
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
 from datetime import date
 
 
+def _to_decimal(value):
+    """Decimal of a float as PostgreSQL casts float8 to numeric (15 significant digits)"""
+    return Decimal('%.15g' % value)
+
+
 class FarmProjectCost(models.Model):
     _name = 'farm.project.cost'
     _description = 'تكاليف مشروع المزرعة'
@@ -216,6 +224,20 @@ class FarmProjectCost(models.Model):
         string='خطوط التوزيع',
     )
     
+    # Compact allocation: no lines, per-house figures derived from the project area weights
+    allocation_mode = fields.Selection([
+        ('lines', 'تفصيلي'),
+        ('compact', 'مضغوط'),
+    ], string='طريقة التوزيع', compute='_compute_allocation_mode', store=True, precompute=True,
+        help='التوزيع المضغوط لا يخزن خطوط توزيع لكل بيت، ويتم اشتقاقها من أوزان المساحة للمشروع عند القراءة')
+    weight_version_id = fields.Many2one(
+        'farm.project.weight.version',
+        string='نسخة أوزان التوزيع',
+        readonly=True,
+        copy=False,
+        ondelete='restrict',
+    )
+    
     # Computed fields
     allocated_amount = fields.Monetary(
         string='المبلغ الموزع',
@@ -233,8 +255,7 @@ class FarmProjectCost(models.Model):
             if vals.get('name', 'جديد') == 'جديد':
                 vals['name'] = self.env['ir.sequence'].next_by_code('farm.project.cost') or 'جديد'
         records = super().create(vals_list)
-        for record in records:
-            record._compute_allocations()
+        records._compute_allocations()
         return records
 
     def write(self, vals):
@@ -243,9 +264,7 @@ class FarmProjectCost(models.Model):
         trigger_fields = ['amount', 'cost_type', 'source_sector_ids', 'source_unit_ids', 
                          'source_house_ids', 'project_id']
         if any(field in vals for field in trigger_fields):
-            for record in self:
-                if record.state == 'draft':
-                    record._compute_allocations()
+            self.filtered(lambda c: c.state == 'draft')._compute_allocations()
         return result
 
     def unlink(self):
@@ -254,25 +273,49 @@ class FarmProjectCost(models.Model):
             raise UserError(_('لا يمكن حذف التكاليف. يمكنك فقط إلغاؤها.'))
         return super().unlink()
 
+    @api.model
+    def _create_and_post(self, vals_list):
+        """Create and post many costs in one call (one allocation insert, one journal entries batch)"""
+        costs = self.create(vals_list)
+        costs._action_post()
+        return costs
+
     # ==========================================
     # ACTION METHODS
     # ==========================================
     
     def action_post(self):
-        """Post the cost and create journal entry (skip if from order)"""
-        for cost in self:
-            if cost.state != 'draft':
+        """Post the costs (in the background when many are posted at once)"""
+        if self.env['farm.job']._should_defer(len(self)):
+            if any(cost.state != 'draft' for cost in self):
                 raise UserError(_('يمكن ترحيل التكاليف في حالة المسودة فقط'))
-            
+            self.filtered(lambda c: not c.order_id)._check_house_analytic_accounts()
+            return self.env['farm.job']._enqueue(
+                _('ترحيل %s تكلفة') % len(self), 'farm.project.cost', '_action_post', self.ids,
+            )._notify_enqueued()
+        return self._action_post()
+
+    def _action_post(self):
+        """Post the costs and create journal entries (skip if from order)"""
+        if any(cost.state != 'draft' for cost in self):
+            raise UserError(_('يمكن ترحيل التكاليف في حالة المسودة فقط'))
+        
+        # Skip journal creation if cost is from an order (order already has its own journal entry)
+        to_journal = self.filtered(lambda c: not c.order_id)
+        to_journal._check_house_analytic_accounts()
+        to_journal._create_accounting_entries()
+        
+        for cost in self:
             if not cost.order_id:
-                # Skip journal creation if cost is from an order (order already has its own journal entry)
-                cost._create_accounting_entry()
                 cost.message_post(body=_('تم ترحيل التكلفة وإنشاء القيد المحاسبي'))
             else:
                 cost.message_post(body=_('تم ترحيل التكلفة (القيد المحاسبي مرتبط بطلب المنتجات)'))
-            
-            # Update state
-            cost.state = 'posted'
+        
+        # Update state
+        self.write({'state': 'posted'})
+        self._trigger_harvest_recalculation()
+        # Re-cost now, so the rest of the transaction reads the new allocations
+        self.env['farm.harvest.recalc.queue']._flush_pending()
         
         return True
 
@@ -304,10 +347,13 @@ class FarmProjectCost(models.Model):
             
             # Update state
             cost.state = 'cancelled'
+            cost._trigger_harvest_recalculation()
             
             # Post message
             cost.message_post(body=_('تم إلغاء التكلفة والقيود المحاسبية المرتبطة'))
         
+        # Re-cost now, so the rest of the transaction reads the new allocations
+        self.env['farm.harvest.recalc.queue']._flush_pending()
         return True
 
     def action_draft(self):
@@ -342,37 +388,47 @@ class FarmProjectCost(models.Model):
     def _create_accounting_entry(self):
         """Create journal entry for the cost"""
         self.ensure_one()
+        return self._create_accounting_entries()
+
+    def _create_accounting_entries(self):
+        """Create and post the journal entries of all costs in the recordset at once"""
+        if not self:
+            return self.env['account.move']
         
-        if not self.payment_account_id:
-            raise UserError(_('يجب تحديد حساب الدفع'))
-        
-        journal = self._get_default_journal()
-        
-        # Prepare move lines
-        move_lines = self._prepare_move_lines()
-        
-        if not move_lines:
-            raise UserError(_('لا يمكن إنشاء قيد محاسبي - لا توجد خطوط'))
-        
-        # Create move
-        move_vals = {
-            'journal_id': journal.id,
-            'date': self.date,
-            'ref': self.name,
-            'narration': self.ledger_description or self.description,
-            'company_id': self.company_id.id,
-            'line_ids': [(0, 0, line) for line in move_lines],
-        }
+        journals = {}
+        move_vals_list = []
+        for cost in self:
+            if not cost.payment_account_id:
+                raise UserError(_('يجب تحديد حساب الدفع'))
+            
+            if cost.company_id not in journals:
+                journals[cost.company_id] = cost._get_default_journal()
+            
+            # Prepare move lines
+            move_lines = cost._prepare_move_lines()
+            
+            if not move_lines:
+                raise UserError(_('لا يمكن إنشاء قيد محاسبي - لا توجد خطوط'))
+            
+            move_vals_list.append({
+                'journal_id': journals[cost.company_id].id,
+                'date': cost.date,
+                'ref': cost.name,
+                'narration': cost.ledger_description or cost.description,
+                'company_id': cost.company_id.id,
+                'line_ids': [(0, 0, line) for line in move_lines],
+            })
         
-        move = self.env['account.move'].create(move_vals)
-        move.action_post()
+        moves = self.env['account.move'].create(move_vals_list)
+        moves.action_post()
         
-        self.move_id = move
+        for cost, move in zip(self, moves):
+            cost.move_id = move
         
         # Create analytic lines for allocations
         self._create_analytic_lines()
         
-        return move
+        return moves
 
     def _prepare_move_lines(self):
         """Prepare journal entry lines"""
@@ -428,25 +484,29 @@ class FarmProjectCost(models.Model):
 
     def _create_analytic_lines(self):
         """Create analytic lines for each house allocation"""
-        self.ensure_one()
+        vals_list = []
+        for cost in self:
+            # Determine the expense account based on cost type
+            if cost.cost_type == 'indirect':
+                general_account_id = cost.indirect_cost_account_id.id
+            else:
+                general_account_id = cost.direct_cost_account_id.id
+            
+            for allocation in cost._get_house_allocations():
+                house = self.env['farm.house'].browse(allocation['house_id'])
+                if house.analytic_account_id:
+                    vals_list.append({
+                        'name': cost.ledger_description or f'{cost.name} - {house.name}',
+                        'account_id': house.analytic_account_id.id,
+                        'amount': -allocation['allocated_amount'],  # Negative for cost
+                        'date': cost.date,
+                        'ref': cost.name,
+                        'company_id': cost.company_id.id,
+                        'general_account_id': general_account_id,
+                    })
         
-        # Determine the expense account based on cost type
-        if self.cost_type == 'indirect':
-            general_account_id = self.indirect_cost_account_id.id
-        else:
-            general_account_id = self.direct_cost_account_id.id
-        
-        for allocation in self.allocation_line_ids:
-            if allocation.house_id.analytic_account_id:
-                self.env['account.analytic.line'].create({
-                    'name': self.ledger_description or f'{self.name} - {allocation.house_id.name}',
-                    'account_id': allocation.house_id.analytic_account_id.id,
-                    'amount': -allocation.allocated_amount,  # Negative for cost
-                    'date': self.date,
-                    'ref': self.name,
-                    'company_id': self.company_id.id,
-                    'general_account_id': general_account_id,
-                })
+        if vals_list:
+            self.env['account.analytic.line'].create(vals_list)
 
     def _cancel_analytic_lines(self):
         """Cancel/delete analytic lines related to this cost"""
@@ -559,11 +619,27 @@ class FarmProjectCost(models.Model):
             else:
                 cost.ledger_description = ''
 
-    @api.depends('allocation_line_ids', 'allocation_line_ids.allocated_amount')
+    @api.depends('cost_type')
+    def _compute_allocation_mode(self):
+        compact_enabled = self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.compact_indirect_allocation'
+        )
+        for cost in self:
+            if compact_enabled and cost.cost_type == 'indirect':
+                cost.allocation_mode = 'compact'
+            else:
+                cost.allocation_mode = 'lines'
+
+    @api.depends('allocation_mode', 'amount', 'weight_version_id',
+                 'allocation_line_ids', 'allocation_line_ids.allocated_amount')
     def _compute_allocated_amount(self):
         for cost in self:
-            cost.allocated_amount = sum(cost.allocation_line_ids.mapped('allocated_amount'))
-            cost.house_count = len(cost.allocation_line_ids)
+            if cost.allocation_mode == 'compact':
+                cost.house_count = len(cost.weight_version_id.line_ids)
+                cost.allocated_amount = cost.amount if cost.house_count else 0
+            else:
+                cost.allocated_amount = sum(cost.allocation_line_ids.mapped('allocated_amount'))
+                cost.house_count = len(cost.allocation_line_ids)
 
     @api.onchange('cost_type')
     def _onchange_cost_type(self):
@@ -584,6 +660,11 @@ class FarmProjectCost(models.Model):
         if not self.project_id or not self.amount:
             return
         
+        # Compact costs have no lines to preview
+        if self.allocation_mode == 'compact':
+            self.allocation_line_ids = [(5, 0, 0)]
+            return
+        
         # Get target houses
         target_houses = self._get_target_houses_preview()
         
@@ -591,30 +672,9 @@ class FarmProjectCost(models.Model):
             self.allocation_line_ids = [(5, 0, 0)]  # Clear
             return
         
-        # Calculate total area
-        total_area = sum(target_houses.mapped('area'))
-        
-        # Create allocation lines (preview)
-        allocation_vals = []
-        if total_area <= 0:
-            house_count = len(target_houses)
-            for house in target_houses:
-                allocation_vals.append((0, 0, {
-                    'house_id': house.id,
-                    'allocated_amount': self.amount / house_count,
-                    'percentage': 100.0 / house_count,
-                }))
-        else:
-            for house in target_houses:
-                percentage = (house.area / total_area) * 100
-                allocated_amount = (house.area / total_area) * self.amount
-                allocation_vals.append((0, 0, {
-                    'house_id': house.id,
-                    'allocated_amount': allocated_amount,
-                    'percentage': percentage,
-                }))
-        
-        self.allocation_line_ids = [(5, 0, 0)] + allocation_vals
+        # Create allocation lines (preview) with the same engine used on save
+        allocation_vals = self._get_allocation_vals(target_houses)
+        self.allocation_line_ids = [(5, 0, 0)] + [(0, 0, vals) for vals in allocation_vals]
 
     def _get_target_houses_preview(self):
         """Get target houses for preview (works with unsaved records)"""
@@ -634,16 +694,10 @@ class FarmProjectCost(models.Model):
         if self.source_house_ids:
             target_houses |= self.source_house_ids
         
-        # Add houses from selected units
-        if self.source_unit_ids:
-            for unit in self.source_unit_ids:
-                target_houses |= unit.house_ids
-        
-        # Add houses from selected sectors (get all houses from all units in sector)
-        if self.source_sector_ids:
-            for sector in self.source_sector_ids:
-                for unit in sector.unit_ids:
-                    target_houses |= unit.house_ids
+        # Add houses from selected sectors and units (one indexed subtree search)
+        target_houses |= self.env['farm.house']._get_subtree_houses(
+            sectors=self.source_sector_ids._origin, units=self.source_unit_ids._origin,
+        )
         
         # Filter to only include houses that are assigned to the project
         target_houses = target_houses & project_houses
@@ -673,42 +727,143 @@ class FarmProjectCost(models.Model):
                     raise ValidationError(_('يجب تحديد حساب التكلفة للتكاليف غير المباشرة'))
 
     def _compute_allocations(self):
-        """Compute cost allocation to houses based on area"""
-        self.ensure_one()
-        
+        """Compute cost allocation to houses based on area, for all costs at once"""
         # Clear existing allocations
-        self.allocation_line_ids.unlink()
+        self.mapped('allocation_line_ids').unlink()
         
-        # Get target houses
-        target_houses = self._get_target_houses()
+        # Compact costs only keep a reference to the project weight version
+        compact_costs = self.filtered(lambda c: c.allocation_mode == 'compact')
+        for project in compact_costs.mapped('project_id'):
+            compact_costs.filtered(lambda c: c.project_id == project).write({
+                'weight_version_id': project._get_weight_version().id,
+            })
+        line_costs = self - compact_costs
+        line_costs.filtered('weight_version_id').write({'weight_version_id': False})
         
-        if not target_houses:
-            return
+        vals_list = []
+        for cost in line_costs:
+            target_houses = cost._get_target_houses()
+            for vals in cost._get_allocation_vals(target_houses):
+                vals['cost_id'] = cost.id
+                vals_list.append(vals)
         
-        # Calculate total area
-        total_area = sum(target_houses.mapped('area'))
+        if vals_list:
+            self.env['farm.cost.allocation'].create(vals_list)
+
+    def _get_allocation_vals(self, target_houses):
+        """
+        Split the cost amount over the target houses by area (equally if no area).
+        Amounts are rounded to the currency with a largest-remainder pass, so the
+        allocation lines always sum exactly to the cost amount.
+        Returns a list of {'house_id', 'allocated_amount', 'percentage'} dicts.
+        """
+        self.ensure_one()
+        if not target_houses:
+            return []
         
-        if total_area <= 0:
+        # Weights of all houses at once
+        weights = target_houses.mapped('area')
+        if sum(weights) <= 0:
             # Equal distribution if no area
-            house_count = len(target_houses)
-            for house in target_houses:
-                self.env['farm.cost.allocation'].create({
-                    'cost_id': self.id,
-                    'house_id': house.id,
-                    'allocated_amount': self.amount / house_count,
-                    'percentage': 100.0 / house_count,
-                })
-        else:
-            # Distribution by area
-            for house in target_houses:
-                percentage = (house.area / total_area) * 100
-                allocated_amount = (house.area / total_area) * self.amount
-                self.env['farm.cost.allocation'].create({
-                    'cost_id': self.id,
-                    'house_id': house.id,
-                    'allocated_amount': allocated_amount,
-                    'percentage': percentage,
-                })
+            weights = [1.0] * len(target_houses)
+        return self._split_amount(target_houses.ids, weights)
+
+    def _split_amount(self, house_ids, weights, total_weight=None):
+        """Largest-remainder split of the cost amount over house_ids by weights"""
+        self.ensure_one()
+        if total_weight is None:
+            total_weight = sum(weights)
+        
+        # Work in currency units (e.g. cents) so rounding is exact. Decimal
+        # with half-up rounding matches the numeric arithmetic of
+        # farm.cost.allocation.report, so both give the same split.
+        currency = self.currency_id or self.env.company.currency_id
+        amount_units = (_to_decimal(self.amount) / _to_decimal(currency.rounding)).quantize(
+            Decimal(1), rounding=ROUND_HALF_UP)
+        total_weight = _to_decimal(total_weight)
+        exact_units = [amount_units * _to_decimal(weight) / total_weight for weight in weights]
+        units = [math.floor(exact) for exact in exact_units]
+        
+        # Give the units lost by flooring to the largest remainders
+        leftover = int(amount_units) - sum(units)
+        by_remainder = sorted(
+            range(len(units)), key=lambda i: exact_units[i] - units[i], reverse=True,
+        )
+        for i in by_remainder[:leftover]:
+            units[i] += 1
+        
+        return [
+            {
+                'house_id': house_id,
+                'allocated_amount': currency.round(house_units * currency.rounding),
+                'percentage': weight * 100.0 / float(total_weight),
+            }
+            for house_id, weight, house_units in zip(house_ids, weights, units)
+        ]
+
+    def _get_house_allocations(self):
+        """
+        Per-house allocation of the cost, as returned by _get_allocation_vals:
+        the stored lines, or derived from the weight version for compact costs.
+        """
+        self.ensure_one()
+        if self.allocation_mode == 'compact':
+            weight_lines = self.weight_version_id.line_ids.sorted('id')
+            if not weight_lines:
+                return []
+            return self._split_amount(
+                weight_lines.mapped('house_id').ids, weight_lines.mapped('weight'),
+                self.weight_version_id.total_weight,
+            )
+        return [
+            {
+                'house_id': allocation.house_id.id,
+                'allocated_amount': allocation.allocated_amount,
+                'percentage': allocation.percentage,
+            }
+            for allocation in self.allocation_line_ids
+        ]
+
+    def _get_allocated_houses(self):
+        """Houses the cost is allocated to, in either allocation mode"""
+        self.ensure_one()
+        if self.allocation_mode == 'compact':
+            return self.weight_version_id.line_ids.house_id
+        return self.allocation_line_ids.house_id
+
+    def _check_house_analytic_accounts(self):
+        """
+        Refuse to post costs allocated to houses whose analytic account is not
+        created yet (large imports create them in a background job), since
+        their analytic lines would be skipped.
+        """
+        houses = self.env['farm.house']
+        for cost in self:
+            houses |= cost._get_allocated_houses()
+        pending = houses.filtered(lambda house: not house.analytic_account_id)
+        if pending:
+            raise UserError(_(
+                'لم يتم إنشاء الحسابات التحليلية لبعض البيوت بعد (يتم إنشاؤها في الخلفية). '
+                'يرجى المحاولة بعد انتهاء المهمة الخلفية.\nالبيوت: %s'
+            ) % ', '.join(pending[:10].mapped('name')))
+
+    def _trigger_harvest_recalculation(self):
+        """
+        Queue harvest re-costing for the houses of these costs, after they are
+        posted or cancelled. Allocation lines only queue their houses when
+        they change on a posted cost, so both modes are handled here.
+        """
+        pairs = set()
+        for cost in self:
+            pairs.update((cost.project_id.id, house_id) for house_id in cost._get_allocated_houses().ids)
+        if not pairs:
+            return
+        
+        project_houses = self.env['farm.project.house'].search([
+            ('project_id', 'in', list({project_id for project_id, _house_id in pairs})),
+            ('house_id', 'in', list({house_id for _project_id, house_id in pairs})),
+        ]).filtered(lambda ph: (ph.project_id.id, ph.house_id.id) in pairs)
+        self.env['farm.harvest.recalc.queue']._enqueue(project_houses)
 
     def _get_target_houses(self):
         """Get houses that should receive cost allocation based on source selection"""
@@ -728,16 +883,10 @@ class FarmProjectCost(models.Model):
         if self.source_house_ids:
             target_houses |= self.source_house_ids
         
-        # Add houses from selected units
-        if self.source_unit_ids:
-            for unit in self.source_unit_ids:
-                target_houses |= unit.house_ids
-        
-        # Add houses from selected sectors
-        if self.source_sector_ids:
-            for sector in self.source_sector_ids:
-                for unit in sector.unit_ids:
-                    target_houses |= unit.house_ids
+        # Add houses from selected sectors and units (one indexed subtree search)
+        target_houses |= self.env['farm.house']._get_subtree_houses(
+            sectors=self.source_sector_ids._origin, units=self.source_unit_ids._origin,
+        )
         
         # Filter to only include houses that are assigned to the project
         target_houses = target_houses & project_houses
@@ -750,10 +899,9 @@ class FarmProjectCost(models.Model):
         return {
             'name': _('توزيع التكاليف'),
             'type': 'ir.actions.act_window',
-            'res_model': 'farm.cost.allocation',
-            'view_mode': 'tree,form',
+            'res_model': 'farm.cost.allocation.report',
+            'view_mode': 'tree,pivot',
             'domain': [('cost_id', '=', self.id)],
-            'context': {'default_cost_id': self.id},
         }
 
 
@@ -857,20 +1005,195 @@ class FarmCostAllocation(models.Model):
 
     def _trigger_harvest_recalculation(self):
         """Trigger recalculation of harvest entries for affected project houses"""
-        for allocation in self:
-            if allocation.cost_state != 'posted':
-                continue
-            
-            # Find project house assignments for this house in this project
-            project_houses = self.env['farm.project.house'].search([
-                ('project_id', '=', allocation.project_id.id),
-                ('house_id', '=', allocation.house_id.id),
-            ])
-            
-            # Recalculate all harvest entries for these project houses
-            for ph in project_houses:
-                entries = self.env['farm.harvest.entry'].search([
-                    ('project_house_id', '=', ph.id),
-                ], order='date, id')
-                for entry in entries:
-                    entry._calculate_cost_allocation()
+        posted = self.filtered(lambda a: a.cost_state == 'posted')
+        if not posted:
+            return
+        
+        # Find project house assignments for the affected (project, house) pairs
+        pairs = {(allocation.project_id.id, allocation.house_id.id) for allocation in posted}
+        project_houses = self.env['farm.project.house'].search([
+            ('project_id', 'in', posted.mapped('project_id').ids),
+            ('house_id', 'in', posted.mapped('house_id').ids),
+        ]).filtered(lambda ph: (ph.project_id.id, ph.house_id.id) in pairs)
+        
+        # Queue the houses: each one is re-costed once at the end of the transaction
+        self.env['farm.harvest.recalc.queue']._enqueue(project_houses)
+
+    @api.model
+    def _get_house_cost_totals(self, project_houses):
+        """
+        Return the total posted cost allocated to each house of the given
+        project house assignments, as {(project_id, house_id): amount}.
+        """
+        if not project_houses:
+            return {}
+        groups = self.env['farm.cost.allocation.report']._read_group(
+            [
+                ('project_id', 'in', project_houses.mapped('project_id').ids),
+                ('house_id', 'in', project_houses.mapped('house_id').ids),
+                ('cost_state', '=', 'posted'),
+            ],
+            ['project_id', 'house_id'],
+            ['allocated_amount:sum'],
+        )
+        return {
+            (project.id, house.id): amount
+            for project, house, amount in groups
+        }
+
+
+class FarmCostAllocationReport(models.Model):
+    """
+    Read-only SQL view of the per-house cost allocations. Costs with allocation
+    lines are read as they are; compact costs are expanded from their project
+    weight version with the same largest-remainder rounding as
+    FarmProjectCost._split_amount, only when the view is queried.
+    """
+    _name = 'farm.cost.allocation.report'
+    _description = 'تقرير توزيع تكاليف المشروع'
+    _auto = False
+    _order = 'cost_date desc, cost_id desc, house_id'
+    _depends = {
+        'farm.cost.allocation': [
+            'cost_id', 'house_id', 'sector_id', 'unit_id', 'house_area',
+            'allocated_amount', 'percentage',
+        ],
+        'farm.project.cost': [
+            'project_id', 'farm_id', 'company_id', 'cost_type', 'allocation_mode',
+            'weight_version_id', 'amount', 'date', 'state', 'harvest_entry_id',
+        ],
+        'farm.project.weight.version': ['total_weight'],
+        'farm.project.weight.line': ['version_id', 'house_id', 'weight'],
+        'farm.house': ['sector_id', 'unit_id', 'area'],
+    }
+
+    cost_id = fields.Many2one('farm.project.cost', string='التكلفة', readonly=True)
+    project_id = fields.Many2one('farm.project', string='المشروع', readonly=True)
+    farm_id = fields.Many2one('farm.farm', string='المزرعة', readonly=True)
+    company_id = fields.Many2one('res.company', string='الشركة', readonly=True)
+    cost_type = fields.Selection([
+        ('direct', 'مباشر'),
+        ('indirect', 'غير مباشر'),
+    ], string='نوع التكلفة', readonly=True)
+    allocation_mode = fields.Selection([
+        ('lines', 'تفصيلي'),
+        ('compact', 'مضغوط'),
+    ], string='طريقة التوزيع', readonly=True)
+    is_harvest_cost = fields.Boolean(string='تكلفة حصاد', readonly=True)
+    house_id = fields.Many2one('farm.house', string='البيت', readonly=True)
+    sector_id = fields.Many2one('farm.sector', string='القطاع', readonly=True)
+    unit_id = fields.Many2one('farm.unit', string='الوحدة', readonly=True)
+    house_area = fields.Float(string='المساحة (م²)', readonly=True)
+    allocated_amount = fields.Monetary(
+        string='المبلغ المخصص',
+        currency_field='currency_id',
+        readonly=True,
+    )
+    currency_id = fields.Many2one('res.currency', string='العملة', readonly=True)
+    percentage = fields.Float(string='النسبة (%)', digits=(16, 2), readonly=True, group_operator='avg')
+    cost_per_sqm = fields.Float(string='التكلفة/م²', digits=(16, 2), readonly=True, group_operator='avg')
+    cost_date = fields.Date(string='تاريخ التكلفة', readonly=True)
+    cost_state = fields.Selection([
+        ('draft', 'مسودة'),
+        ('posted', 'مرحّل'),
+        ('cancelled', 'ملغى'),
+    ], string='حالة التكلفة', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        # Compact rows get a negative id built from (cost, house) so ids stay
+        # stable without a global row_number(), which would stop PostgreSQL from
+        # pushing filters down. The window only partitions by cost columns, so
+        # filters on project, farm, type, state or date still reach the tables.
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW %s AS (
+                SELECT
+                    a.id AS id,
+                    a.cost_id AS cost_id,
+                    c.project_id AS project_id,
+                    c.farm_id AS farm_id,
+                    c.company_id AS company_id,
+                    c.cost_type AS cost_type,
+                    'lines' AS allocation_mode,
+                    c.harvest_entry_id IS NOT NULL AS is_harvest_cost,
+                    a.house_id AS house_id,
+                    a.sector_id AS sector_id,
+                    a.unit_id AS unit_id,
+                    a.house_area AS house_area,
+                    a.allocated_amount AS allocated_amount,
+                    comp.currency_id AS currency_id,
+                    a.percentage AS percentage,
+                    CASE WHEN a.house_area > 0
+                         THEN a.allocated_amount / a.house_area ELSE 0 END AS cost_per_sqm,
+                    c.date AS cost_date,
+                    c.state AS cost_state
+                FROM farm_cost_allocation a
+                JOIN farm_project_cost c ON c.id = a.cost_id
+                JOIN res_company comp ON comp.id = c.company_id
+                WHERE c.allocation_mode IS DISTINCT FROM 'compact'
+
+                UNION ALL
+
+                SELECT
+                    -((s.cost_id::bigint << 24) + s.house_id) AS id,
+                    s.cost_id,
+                    s.project_id,
+                    s.farm_id,
+                    s.company_id,
+                    s.cost_type,
+                    'compact' AS allocation_mode,
+                    s.is_harvest_cost,
+                    s.house_id,
+                    h.sector_id,
+                    h.unit_id,
+                    h.area AS house_area,
+                    s.allocated_amount,
+                    s.currency_id,
+                    s.percentage,
+                    CASE WHEN h.area > 0
+                         THEN s.allocated_amount / h.area ELSE 0 END AS cost_per_sqm,
+                    s.cost_date,
+                    s.cost_state
+                FROM (
+                    SELECT
+                        u.cost_id, u.project_id, u.farm_id, u.company_id, u.cost_type,
+                        u.is_harvest_cost, u.house_id, u.currency_id, u.cost_date, u.cost_state,
+                        u.weight * 100.0 / u.total_weight AS percentage,
+                        -- Largest remainder: floored units, plus one for the
+                        -- houses with the biggest remainders until the total matches
+                        (FLOOR(u.exact_units)
+                            + CASE WHEN ROW_NUMBER() OVER (w ORDER BY u.exact_units - FLOOR(u.exact_units) DESC, u.line_id)
+                                        <= u.amount_units - SUM(FLOOR(u.exact_units)) OVER w
+                                   THEN 1 ELSE 0 END
+                        ) * u.rounding AS allocated_amount
+                    FROM (
+                        SELECT
+                            c.id AS cost_id,
+                            c.project_id AS project_id,
+                            c.farm_id AS farm_id,
+                            c.company_id AS company_id,
+                            c.cost_type AS cost_type,
+                            c.harvest_entry_id IS NOT NULL AS is_harvest_cost,
+                            c.date AS cost_date,
+                            c.state AS cost_state,
+                            l.id AS line_id,
+                            l.house_id AS house_id,
+                            l.weight AS weight,
+                            v.total_weight AS total_weight,
+                            cur.id AS currency_id,
+                            cur.rounding AS rounding,
+                            ROUND(c.amount / cur.rounding) AS amount_units,
+                            ROUND(c.amount / cur.rounding) * l.weight::numeric / v.total_weight::numeric AS exact_units
+                        FROM farm_project_cost c
+                        JOIN farm_project_weight_version v ON v.id = c.weight_version_id
+                        JOIN farm_project_weight_line l ON l.version_id = v.id
+                        JOIN res_company comp ON comp.id = c.company_id
+                        JOIN res_currency cur ON cur.id = comp.currency_id
+                        WHERE c.allocation_mode = 'compact' AND v.total_weight > 0
+                    ) u
+                    WINDOW w AS (PARTITION BY u.cost_id, u.project_id, u.farm_id, u.company_id,
+                                              u.cost_type, u.is_harvest_cost, u.cost_date, u.cost_state)
+                ) s
+                JOIN farm_house h ON h.id = s.house_id
+            )
+        """ % self._table)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+
+from .sale_order import PACKING_CHANNEL_PREFIX
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        """
+        Packing screens subscribe to 'farm_packing_order_<id>'; it is replaced
+        by the order's own channel when the user can read the order.
+        """
+        channels = list(channels)
+        packing_channels = [
+            channel for channel in channels
+            if isinstance(channel, str) and channel.startswith(PACKING_CHANNEL_PREFIX)
+        ]
+        if packing_channels:
+            channels = [channel for channel in channels if channel not in packing_channels]
+            order_ids = [
+                int(channel[len(PACKING_CHANNEL_PREFIX):]) for channel in packing_channels
+                if channel[len(PACKING_CHANNEL_PREFIX):].isdigit()
+            ]
+            orders = self.env['sale.order'].browse(order_ids).exists()
+            if orders and orders.check_access_rights('read', raise_exception=False):
+                channels.extend(orders._filter_access_rules('read'))
+        return super()._build_bus_channel_list(channels)
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import re
-from odoo import models, fields, api
+from odoo import models, fields, api, _
 
 
 class ResConfigSettings(models.TransientModel):
@@ -39,6 +39,119 @@ class ResConfigSettings(models.TransientModel):
         domain="[('usage', '=', 'internal')]",
     )
 
+    # Compact storage of project-wide indirect costs
+    farm_compact_indirect_allocation = fields.Boolean(
+        string='توزيع مضغوط للتكاليف غير المباشرة',
+        help='لا يتم إنشاء خطوط توزيع لكل بيت للتكاليف غير المباشرة الجديدة، بل تُحفظ أوزان المساحة للمشروع ويُشتق التوزيع عند القراءة',
+        config_parameter='farm_management.compact_indirect_allocation',
+    )
+    farm_sync_analytic_names = fields.Boolean(
+        string='مزامنة أسماء الحسابات التحليلية',
+        help='عند إعادة تسمية مزرعة أو قطاع أو وحدة أو بيت، تتم إعادة تسمية الحسابات التحليلية للبيوت التابعة حسب اسمها الكامل الجديد',
+        config_parameter='farm_management.sync_analytic_names',
+    )
+
+    # Background jobs
+    farm_job_threshold = fields.Integer(
+        string='حد المهام الخلفية',
+        help='العمليات التي تتجاوز هذا العدد من البنود (بيوت، أسطر استيراد، تكاليف) تُنفذ في الخلفية على دفعات. صفر يعني دائماً مباشرة.',
+        config_parameter='farm_management.job_threshold',
+        default=100,
+    )
+    farm_house_analytic_async_threshold = fields.Integer(
+        string='حد إنشاء الحسابات التحليلية في الخلفية',
+        help='عند إنشاء عدد من البيوت يتجاوز هذا الحد دفعة واحدة (استيراد كبير)، تُنشأ حساباتها التحليلية في الخلفية. '
+             'حتى تنتهي المهمة الخلفية تبقى هذه البيوت بدون حساب تحليلي ولا يمكن ترحيل تكاليف موزعة عليها. '
+             'صفر يعني دائماً مباشرة.',
+        config_parameter='farm_management.house_analytic_async_threshold',
+        default=500,
+    )
+    farm_job_retention_days = fields.Integer(
+        string='مدة الاحتفاظ بالمهام المنتهية (أيام)',
+        help='المهام الخلفية المنتهية أو الفاشلة أو الملغاة الأقدم من هذا العدد من الأيام تُحذف تلقائياً. صفر يعني الاحتفاظ بها دائماً.',
+        config_parameter='farm_management.job_retention_days',
+        default=30,
+    )
+
+    # Harvest re-costing queue
+    farm_harvest_recalc_async_threshold = fields.Integer(
+        string='حد إعادة الاحتساب في الخلفية',
+        help='عند تجاوز عدد البيوت المتأثرة في عملية واحدة هذا الحد، تتم إعادة احتساب تكلفة الحصاد في الخلفية. صفر يعني دائماً مباشرة.',
+        config_parameter='farm_management.harvest_recalc_async_threshold',
+        default=50,
+    )
+    farm_harvest_recalc_pending_count = fields.Integer(
+        string='إعادات الاحتساب المعلقة',
+        compute='_compute_farm_harvest_recalc_pending_count',
+    )
+
+    # Printer-native pallet labels (ZPL / ESC/POS)
+    farm_label_printer_dpi = fields.Integer(
+        string='دقة طابعة الملصقات (DPI)',
+        help='دقة الطابعة الحرارية: 203 أو 300 أو 600، تُستخدم لأوامر ZPL ولملصقات الأبيض والأسود',
+        config_parameter='farm_management.label_printer_dpi',
+        default=203,
+    )
+    farm_label_prerender = fields.Boolean(
+        string='تجهيز الملصقات مسبقاً',
+        help='عند حفظ الباليت أو محتوياته يتم توليد ملصقه في الخلفية، فتكون الطباعة فورية دون حجز خادم الويب',
+        config_parameter='farm_management.label_prerender',
+    )
+    farm_barcode_format = fields.Selection([
+        ('png', 'صورة PNG'),
+        ('svg', 'SVG (رسم متجه)'),
+    ], string='صيغة باركود الملصقات',
+        help='SVG لا يحتاج مكتبة PIL وأخف عند طباعة ملصقات بها أسطر كثيرة',
+        config_parameter='farm_management.barcode_format',
+        default='png',
+    )
+    farm_label_color_mode = fields.Selection([
+        ('color', 'ألوان'),
+        ('mono', 'أبيض وأسود (حد فاصل)'),
+        ('mono_dither', 'أبيض وأسود (تنقيط)'),
+    ], string='ألوان ملصقات PDF',
+        help='للطابعات الحرارية أحادية اللون: يتم تحويل الملصق إلى صورة 1-بت بدقة الطابعة، فيصغر حجم الملف وتسرع الطباعة',
+        config_parameter='farm_management.label_color_mode',
+        default='color',
+    )
+    farm_zpl_font = fields.Char(
+        string='خط ZPL',
+        help='ملف خط محمل على الطابعة يدعم العربية، مثال: E:TT0003M_.TTF. فارغ يعني الخط المدمج.',
+        config_parameter='farm_management.zpl_font',
+    )
+    farm_escpos_encoding = fields.Char(
+        string='ترميز ESC/POS',
+        help='ترميز Python المطابق لجدول الأحرف في طابعة الإيصالات، مثال: cp1256 أو cp864',
+        config_parameter='farm_management.escpos_encoding',
+        default='cp1256',
+    )
+    farm_escpos_code_table = fields.Integer(
+        string='رقم جدول الأحرف ESC/POS',
+        help='رقم جدول الأحرف (أمر ESC t) للترميز المختار حسب دليل الطابعة',
+        config_parameter='farm_management.escpos_code_table',
+        default=50,
+    )
+
+    def _compute_farm_harvest_recalc_pending_count(self):
+        pending_count = self.env['farm.harvest.recalc.queue']._get_pending_count()
+        for settings in self:
+            settings.farm_harvest_recalc_pending_count = pending_count
+
+    def action_process_harvest_recalc_queue(self):
+        """Wake up the cron to process pending harvest re-costing now"""
+        cron = self.env.ref('farm_management.ir_cron_farm_harvest_recalc', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('إعادة احتساب تكلفة الحصاد'),
+                'message': _('تمت جدولة معالجة %s بيت/بيوت معلقة') % self.farm_harvest_recalc_pending_count,
+                'type': 'info',
+            },
+        }
+
     @api.model
     def get_values(self):
         res = super().get_values()
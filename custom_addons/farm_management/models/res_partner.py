@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from odoo import api, fields, models, _
+from odoo.tools import SQL
 
 
 class ResPartnerProductCode(models.Model):
@@ -83,9 +84,48 @@ class ResPartner(models.Model):
     def get_product_barcode(self, product):
         """Get the barcode for a product: custom code if exists, else default_code"""
         self.ensure_one()
-        custom = self.product_code_ids.filtered(lambda c: c.product_id == product)
-        if custom:
-            return custom[0].custom_code
-        return product.default_code or ''
+        return self._get_product_barcodes({(self.id, product.id)}).get((self.id, product.id), '')
+
+    @api.model
+    def _get_product_barcodes(self, pairs):
+        """
+        Resolve the barcodes of many (partner_id, product_id) pairs at once:
+        the partner's custom code if any, else the product default_code.
+        partner_id may be False for the default_code alone.
+
+        Access rights and record rules apply as when reading the codes
+        through the ORM: custom codes hidden from the user by a rule are
+        ignored and the default_code is used instead.
+
+        :return: {(partner_id, product_id): barcode}
+        """
+        pairs = {(partner_id or None, product_id) for partner_id, product_id in pairs if product_id}
+        if not pairs:
+            return {}
+        Code = self.env['res.partner.product.code']
+        Code.check_access_rights('read')
+        self.env['product.product'].check_access_rights('read')
+        Code.flush_model(['partner_id', 'product_id', 'custom_code'])
+        self.env['product.product'].flush_model(['default_code'])
+        partner_ids, product_ids = zip(*pairs)
+        # Codes the user may read, with the record rules applied
+        codes = Code._search([
+            ('partner_id', 'in', [partner_id for partner_id in partner_ids if partner_id]),
+            ('product_id', 'in', list(product_ids)),
+        ])
+        self.env.cr.execute(SQL("""
+            SELECT pair.partner_id, pair.product_id,
+                   COALESCE(code.custom_code, product.default_code, '')
+              FROM unnest(%s::int[], %s::int[]) AS pair(partner_id, product_id)
+              JOIN product_product product ON product.id = pair.product_id
+         LEFT JOIN res_partner_product_code code
+                ON code.partner_id = pair.partner_id
+               AND code.product_id = pair.product_id
+               AND code.id IN %s
+        """, list(partner_ids), list(product_ids), codes.subselect()))
+        return {
+            (partner_id or False, product_id): barcode
+            for partner_id, product_id, barcode in self.env.cr.fetchall()
+        }
 
 
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 
+# Bus channel of the live packing screen of an order: PACKING_CHANNEL_PREFIX + order id
+PACKING_CHANNEL_PREFIX = 'farm_packing_order_'
+PACKING_NOTIFICATION = 'farm_management.packing_progress'
+
 
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
@@ -38,10 +44,139 @@ class SaleOrder(models.Model):
             order.total_pallet_kg = sum(order.pallet_ids.mapped('total_kg'))
             order.total_pallet_boxes = sum(order.pallet_ids.mapped('total_boxes'))
 
+    def _get_palletized_kg(self, pallet=None):
+        """
+        Palletized kg per product of the order, {product_id: kg}, read with
+        one grouped query. `pallet` is a pallet being edited in a form: its
+        unsaved lines replace its saved ones.
+        """
+        self.ensure_one()
+        palletized = defaultdict(float)
+        if self._origin.id:
+            for product, subtotal_kg in self.env['sale.order.pallet.line']._read_group(
+                [('order_id', '=', self._origin.id)], ['product_id'], ['subtotal_kg:sum'],
+            ):
+                palletized[product.id] = subtotal_kg
+        if pallet is not None:
+            for line in pallet._origin.line_ids:
+                palletized[line.product_id.id] -= line.subtotal_kg
+            for line in pallet.line_ids:
+                palletized[line.product_id.id] += line.box_weight_kg * line.box_quantity
+        return palletized
+
+    def _get_pallet_progress(self, pallet=None):
+        """
+        Palletizing progress per product of the order: {product_id: values}
+        with ordered_qty, uom, palletized_qty, remaining_qty,
+        progress_percent, is_complete and is_over.
+        """
+        self.ensure_one()
+        palletized = self._get_palletized_kg(pallet)
+        ordered = defaultdict(float)
+        uoms = {}
+        for so_line in self.order_line:
+            ordered[so_line.product_id.id] += so_line.product_uom_qty
+            uoms.setdefault(so_line.product_id.id, so_line.product_uom.name or '')
+        
+        progress = {}
+        for product_id in set(ordered) | set(palletized):
+            ordered_qty = ordered.get(product_id, 0.0)
+            palletized_qty = palletized.get(product_id, 0.0)
+            progress[product_id] = {
+                'ordered_qty': ordered_qty,
+                'uom': uoms.get(product_id, ''),
+                'palletized_qty': palletized_qty,
+                'remaining_qty': max(0, ordered_qty - palletized_qty),
+                'progress_percent': (palletized_qty / ordered_qty * 100) if ordered_qty > 0 else 0,
+                'is_complete': palletized_qty >= ordered_qty if ordered_qty > 0 else False,
+                'is_over': palletized_qty > ordered_qty if ordered_qty > 0 else False,
+            }
+        return progress
+
+    def get_packing_screen_data(self):
+        """Initial state of the live packing screen; later changes arrive as bus deltas"""
+        self.ensure_one()
+        progress = self._get_pallet_progress()
+        boxes = {
+            product.id: box_quantity
+            for product, box_quantity in self.env['sale.order.pallet.line']._read_group(
+                [('order_id', '=', self.id)], ['product_id'], ['box_quantity:sum'],
+            )
+        }
+        products = self.env['product.product'].browse(list(progress))
+        return {
+            'order_id': self.id,
+            'order_name': self.name,
+            'partner_name': self.partner_id.display_name,
+            'pallet_count': len(self.pallet_ids),
+            'products': [{
+                'product_id': product.id,
+                'product_name': product.display_name,
+                'ordered_qty': progress[product.id]['ordered_qty'],
+                'uom': progress[product.id]['uom'],
+                'palletized_qty': progress[product.id]['palletized_qty'],
+                'boxes': boxes.get(product.id, 0),
+            } for product in products],
+        }
+
+    @api.model
+    def _queue_packing_delta(self, order_id, product_id=None, kg=0.0, boxes=0, pallets=0):
+        """
+        Add a change of palletized kg, boxes or pallet count to the progress
+        deltas of the transaction. They are sent to the packing screens of
+        each order in one bus message right before commit.
+        """
+        if not order_id:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get('farm_management.packing_deltas')
+        if pending is None:
+            pending = data['farm_management.packing_deltas'] = {}
+            self.env.cr.precommit.add(self._flush_packing_deltas)
+        order_delta = pending.setdefault(order_id, {'pallets': 0, 'products': defaultdict(lambda: [0.0, 0])})
+        order_delta['pallets'] += pallets
+        if product_id:
+            order_delta['products'][product_id][0] += kg
+            order_delta['products'][product_id][1] += boxes
+
+    @api.model
+    def _flush_packing_deltas(self):
+        """Send the progress deltas collected during the transaction over the bus"""
+        pending = self.env.cr.precommit.data.pop('farm_management.packing_deltas', {})
+        orders = self.browse(list(pending)).exists()
+        product_ids = {product_id for delta in pending.values() for product_id in delta['products']}
+        names = {product.id: product.display_name for product in self.env['product.product'].browse(product_ids)}
+        for order in orders:
+            delta = pending[order.id]
+            lines = [{
+                'product_id': product_id,
+                'product_name': names.get(product_id, ''),
+                'kg': kg,
+                'boxes': boxes,
+            } for product_id, (kg, boxes) in delta['products'].items() if kg or boxes]
+            if not lines and not delta['pallets']:
+                continue
+            self.env['bus.bus']._sendone(order, PACKING_NOTIFICATION, {
+                'order_id': order.id,
+                'pallets': delta['pallets'],
+                'lines': lines,
+            })
+
+    def action_open_packing_screen(self):
+        """Open the live packing screen of the order"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'farm_management.packing_screen',
+            'name': _('شاشة التعبئة - %s') % self.name,
+            'params': {'order_id': self.id},
+        }
+
     def get_pallet_progress_summary(self):
         """Get palletizing progress for each product in the order"""
         self.ensure_one()
         summary = []
+        palletized = self._get_palletized_kg()
         
         for line in self.order_line:
             product = line.product_id
@@ -49,10 +184,7 @@ class SaleOrder(models.Model):
             uom = line.product_uom.name
             
             # Get palletized qty for this product
-            pallet_lines = self.pallet_ids.mapped('line_ids').filtered(
-                lambda l: l.product_id == product
-            )
-            palletized_qty = sum(pallet_lines.mapped('subtotal_kg'))
+            palletized_qty = palletized.get(product.id, 0.0)
             
             remaining = max(0, ordered_qty - palletized_qty)
             progress = (palletized_qty / ordered_qty * 100) if ordered_qty > 0 else 0
@@ -116,11 +248,15 @@ class SaleOrder(models.Model):
                     'type': 'warning',
                 }
             }
-        # Use custom image-based PDF endpoint with comma-separated IDs
+        waiting = self.pallet_ids._wait_for_label_prerender()
+        if waiting:
+            return waiting
+        # Use custom image-based PDF endpoint with comma-separated IDs, all labels in one page load,
+        # streamed as one page per label
         pallet_ids = ','.join(str(p.id) for p in self.pallet_ids)
         return {
             'type': 'ir.actions.act_url',
-            'url': f'/report/pallet_label/{pallet_ids}',
+            'url': f'/report/pallet_label/{pallet_ids}?batch=1&layout=pages',
             'target': 'new',
         }
 
@@ -1,17 +1,65 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import functools
+import hashlib
+import json
 from io import BytesIO
 
 from odoo import api, fields, models, _
 
+from ..services.pallet_label_renderer import PalletLabelRenderer
+
 try:
     from barcode import Code128
-    from barcode.writer import ImageWriter
+    from barcode.writer import ImageWriter, SVGWriter
     BARCODE_AVAILABLE = True
 except ImportError:
     BARCODE_AVAILABLE = False
 
+BARCODE_OPTIONS = (
+    ('font_size', 8),
+    ('module_height', 8),
+    ('module_width', 0.3),
+    ('quiet_zone', 2),
+    ('text_distance', 3),
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _barcode_data_uri(value, output_format='png', options=BARCODE_OPTIONS):
+    """
+    Code128 barcode as a data URI, memoised per process: the same product or
+    customer code repeats on almost every pallet of an order. The SVG output
+    does not need PIL and keeps labels with many lines light.
+    """
+    buffer = BytesIO()
+    if output_format == 'svg':
+        Code128(value, writer=SVGWriter()).write(buffer, options=dict(options))
+        mimetype = 'image/svg+xml'
+    else:
+        Code128(value, writer=ImageWriter()).write(buffer, options=dict(options))
+        mimetype = 'image/png'
+    return 'data:%s;base64,%s' % (mimetype, base64.b64encode(buffer.getvalue()).decode('utf-8'))
+
+
+# Pallet fields shown on the label; saving them re-renders the label in the background
+LABEL_PALLET_FIELDS = {'name', 'order_id', 'line_ids'}
+LABEL_LINE_FIELDS = {'pallet_id', 'product_id', 'box_weight_kg', 'box_quantity'}
+PACKING_LINE_FIELDS = LABEL_LINE_FIELDS
+
+# Rendered label cache: bump LABEL_CACHE_VERSION when the rendering pipeline
+# changes in a way the label templates do not show
+LABEL_CACHE_VERSION = '3'
+# attachment name: <prefix><output format>/<key>
+LABEL_CACHE_PREFIX = 'pallet_label_cache_'
+LABEL_TEMPLATES = (
+    'farm_management.report_pallet_label_standalone_style',
+    'farm_management.report_pallet_label_standalone_label',
+    'farm_management.report_pallet_label_standalone',
+    'farm_management.report_pallet_label_standalone_batch',
+)
+
 
 class SaleOrderPallet(models.Model):
     _name = 'sale.order.pallet'
@@ -94,11 +142,31 @@ class SaleOrderPallet(models.Model):
                 order = self.env['sale.order'].browse(vals['order_id'])
                 pallet_count = len(order.pallet_ids) + 1
                 vals['name'] = _('باليت %s') % pallet_count
-        return super().create(vals_list)
+        pallets = super().create(vals_list)
+        pallets._schedule_label_prerender()
+        for pallet in pallets:
+            self.env['sale.order']._queue_packing_delta(pallet.order_id.id, pallets=1)
+        return pallets
+
+    def write(self, vals):
+        res = super().write(vals)
+        if LABEL_PALLET_FIELDS.intersection(vals):
+            self._schedule_label_prerender()
+        return res
+
+    def unlink(self):
+        # Lines are removed by the database cascade, not by their unlink()
+        self.line_ids._queue_packing_deltas(sign=-1)
+        for pallet in self:
+            self.env['sale.order']._queue_packing_delta(pallet.order_id.id, pallets=-1)
+        return super().unlink()
 
     def action_print_label(self):
         """Print shipping label for this pallet using image-based PDF for exact roll sizing"""
         self.ensure_one()
+        waiting = self._wait_for_label_prerender()
+        if waiting:
+            return waiting
         # Use custom image-based PDF endpoint
         return {
             'type': 'ir.actions.act_url',
@@ -106,11 +174,213 @@ class SaleOrderPallet(models.Model):
             'target': 'new',
         }
     
+    def action_print_label_zpl(self):
+        """Download the label as ZPL for Zebra thermal printers"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/report/pallet_label/{self.id}?output=zpl',
+            'target': 'new',
+        }
+    
     def action_print_label_standard(self):
         """Fallback: Print using standard QWeb PDF"""
         self.ensure_one()
         return self.env.ref('farm_management.action_report_pallet_label').report_action(self)
 
+    def _get_label_data(self, barcodes=None):
+        """Plain label content of each pallet, for printer-native label formats"""
+        printed_at = fields.Datetime.context_timestamp(self, fields.Datetime.now()).strftime('%Y-%m-%d %H:%M')
+        if barcodes is None:
+            barcodes = self.line_ids._get_barcodes()
+        labels = []
+        for pallet in self:
+            partner = pallet.partner_id
+            labels.append({
+                'company_name': pallet.company_id.name or '',
+                'order_name': pallet.order_id.name or '',
+                'pallet_name': pallet.name or '',
+                'partner_name': partner.name or '',
+                'partner_address': '، '.join(filter(None, [partner.city, partner.country_id.name])),
+                'lines': [{
+                    'product_name': line.product_id.name or '',
+                    'box_weight_kg': line.box_weight_kg,
+                    'box_quantity': line.box_quantity,
+                    'subtotal_kg': line.subtotal_kg,
+                    'barcode': barcodes.get(line.id, ''),
+                } for line in pallet.line_ids],
+                'total_boxes': pallet.total_boxes,
+                'total_kg': pallet.total_kg,
+                'printed_at': printed_at,
+            })
+        return labels
+
+    # ========== Rendered Label Cache ==========
+
+    @api.model
+    def _get_label_template_version(self):
+        """Hash of the label templates and their inheriting views"""
+        views = self.env['ir.ui.view'].sudo().search([('key', 'in', LABEL_TEMPLATES)])
+        views |= views.inherit_children_ids
+        content = ''.join('%s:%s' % (view.id, view.arch_db) for view in views.sorted('id'))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _get_label_print_date(self):
+        """Print date shown on the rendered labels, in the user's timezone"""
+        return fields.Datetime.context_timestamp(self, fields.Datetime.now()).strftime('%Y-%m-%d')
+
+    @api.model
+    def _get_label_cache_name(self, output_format, key):
+        return '%s%s/%s' % (LABEL_CACHE_PREFIX, output_format, key)
+
+    def _get_label_cache_keys(self, output_format='png', barcodes=None, print_date=None):
+        """
+        Cache key of each pallet's rendered label: a hash of everything the
+        label shows (lines, partner product codes, customer, company, print
+        date), the template version and the output format. The rendered
+        labels show the print date without the time, so a reprint of an
+        unchanged pallet on the same day reuses the first rendering.
+        """
+        print_date = print_date or self._get_label_print_date()
+        template_version = self._get_label_template_version()
+        params = self.env['ir.config_parameter'].sudo()
+        render_options = [
+            params.get_param('farm_management.barcode_format', 'png'),
+            params.get_param('farm_management.label_font_path'),
+            params.get_param('farm_management.label_font_bold_path'),
+        ]
+        keys = {}
+        for pallet, data in zip(self, self._get_label_data(barcodes)):
+            data['printed_at'] = print_date
+            payload = json.dumps([
+                LABEL_CACHE_VERSION, template_version, output_format, render_options, data,
+                str(pallet.company_id.write_date),  # logo
+            ], sort_keys=True, default=str)
+            keys[pallet.id] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return keys
+
+    def _get_cached_label_images(self, keys, output_format='png'):
+        """Return {pallet_id: image} for the pallets whose label is cached under its current key"""
+        names = {pallet_id: self._get_label_cache_name(output_format, key) for pallet_id, key in keys.items()}
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', list(keys)),
+            ('name', 'in', list(names.values())),
+        ])
+        return {
+            attachment.res_id: attachment.raw
+            for attachment in attachments
+            if attachment.name == names[attachment.res_id]
+        }
+
+    # ========== Background Pre-render ==========
+
+    def _schedule_label_prerender(self):
+        """
+        Queue these pallets for label pre-rendering. Pallets are collected for
+        the whole transaction and handed to the background before commit, to
+        the pre-render job that has not started yet if there is one.
+        """
+        if not self or self.env['ir.config_parameter'].sudo().get_param(
+            'farm_management.label_prerender') not in ('True', '1'):
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get('farm_management.label_prerender')
+        if pending is None:
+            pending = data['farm_management.label_prerender'] = set()
+            self.env.cr.precommit.add(self._flush_label_prerender)
+        pending.update(self.ids)
+
+    @api.model
+    def _flush_label_prerender(self):
+        """Start the pre-render job of the pallets collected during the transaction"""
+        ids = self.env.cr.precommit.data.pop('farm_management.label_prerender', set())
+        pallets = self.browse(ids).exists()
+        if not pallets:
+            return
+        self.env['farm.job']._enqueue(
+            _('تجهيز ملصقات الباليت'), self._name, '_prerender_labels', pallets.ids, chunk_size=20,
+            coalesce=True,
+        )
+        self.env.flush_all()
+
+    def _prerender_labels(self):
+        """Render and cache the labels of these pallets (background job), then notify waiting users"""
+        pallets = self.exists()
+        rendered = PalletLabelRenderer().cache_label_images(pallets)
+
+        waiting = self.env['sale.order.pallet.label.request'].sudo().search([
+            ('pallet_id', 'in', pallets.ids),
+        ])
+        for user, requests in waiting.grouped('user_id').items():
+            self.env['bus.bus']._sendone(user.partner_id, 'simple_notification', {
+                'title': _('ملصقات الباليت جاهزة'),
+                'message': _('ملصقات %s جاهزة للطباعة') % '، '.join(requests.pallet_id.mapped('display_name')),
+                'type': 'success',
+                'sticky': True,
+            })
+        waiting.unlink()
+        return _('تم تجهيز %s ملصق') % len(rendered)
+
+    def _wait_for_label_prerender(self):
+        """
+        If labels of these pallets are still waiting for the background
+        pre-render, register the user for a bus notification once they are
+        ready and return a notification action, instead of rendering them
+        inside the request. Returns False when the labels can be printed now.
+        """
+        jobs = self.env['farm.job'].sudo().search([
+            ('res_model', '=', self._name),
+            ('method', '=', '_prerender_labels'),
+            ('state', 'in', ('pending', 'running')),
+        ])
+        pending_ids = {pallet_id for job in jobs for pallet_id in (job.items or [])[job.offset:]}
+        pallets = self.filtered(lambda p: p.id in pending_ids)
+        if not pallets:
+            return False
+        self.env['sale.order.pallet.label.request'].sudo().create([
+            {'pallet_id': pallet.id, 'user_id': self.env.uid} for pallet in pallets
+        ])
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('جاري تجهيز الملصقات'),
+                'message': _('يتم تجهيز ملصقات %s في الخلفية، ستصلك رسالة عند جاهزيتها للطباعة.') % (
+                    '، '.join(pallets.mapped('display_name'))),
+                'type': 'info',
+                'sticky': False,
+            },
+        }
+
+    @api.model
+    def _store_label_images(self, images, keys, output_format='png', mimetype='image/png'):
+        """
+        Cache rendered labels {pallet_id: image}, replacing older renderings
+        of the same pallets in the same output format; the renderings in the
+        other formats stay cached.
+        """
+        if not images:
+            return
+        Attachment = self.env['ir.attachment'].sudo()
+        Attachment.search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', list(images)),
+            '|',
+            ('name', '=like', self._get_label_cache_name(output_format, '%')),
+            # renderings cached before the output format was part of the name
+            ('name', 'not like', '/'),
+            ('name', '=like', LABEL_CACHE_PREFIX + '%'),
+        ]).unlink()
+        Attachment.create([{
+            'name': self._get_label_cache_name(output_format, keys[pallet_id]),
+            'raw': image,
+            'mimetype': mimetype,
+            'res_model': self._name,
+            'res_id': pallet_id,
+        } for pallet_id, image in images.items()])
+
 
 class SaleOrderPalletLine(models.Model):
     _name = 'sale.order.pallet.line'
@@ -128,6 +398,7 @@ class SaleOrderPalletLine(models.Model):
     order_id = fields.Many2one(
         related='pallet_id.order_id',
         store=True,
+        index=True,
         string='طلب المبيعات',
     )
     
@@ -211,106 +482,202 @@ class SaleOrderPalletLine(models.Model):
 
     @api.depends('product_id', 'box_weight_kg', 'box_quantity')
     def _compute_order_progress(self):
-        for line in self:
-            line._update_order_progress()
+        self._update_order_progress()
 
     def _update_order_progress(self):
-        """Calculate order progress - used by both compute and onchange"""
-        self.ensure_one()
-        ordered_qty = 0.0
-        ordered_uom = ''
-        palletized_qty = 0.0
-        
-        if self.product_id and self.pallet_id and self.pallet_id.order_id:
-            order = self.pallet_id.order_id
-            product = self.product_id
-            
-            # Get ordered quantity from SO lines
-            so_lines = order.order_line.filtered(
-                lambda l: l.product_id == product
-            )
-            ordered_qty = sum(so_lines.mapped('product_uom_qty'))
-            if so_lines:
-                ordered_uom = so_lines[0].product_uom.name or ''
-            
-            # Collect IDs of all unsaved lines in current pallet for this product
-            current_pallet_line_ids = set()
-            current_pallet_subtotal = 0.0
-            
-            if self.pallet_id.line_ids:
-                for line in self.pallet_id.line_ids:
-                    if line.product_id == product:
-                        # Calculate from current form values (might be unsaved)
-                        current_pallet_subtotal += line.box_weight_kg * line.box_quantity
-                        # Track the origin IDs to exclude from DB query
-                        if line._origin and line._origin.id:
-                            current_pallet_line_ids.add(line._origin.id)
-            
-            # Get palletized qty from OTHER pallets (saved in DB) for this product
-            domain = [
-                ('order_id', '=', order.id),
-                ('product_id', '=', product.id),
-            ]
-            # Exclude lines that are in our current pallet (we already counted them)
-            if current_pallet_line_ids:
-                domain.append(('id', 'not in', list(current_pallet_line_ids)))
-            
-            other_pallets_lines = self.env['sale.order.pallet.line'].search(domain)
-            other_pallets_subtotal = sum(other_pallets_lines.mapped('subtotal_kg'))
+        """
+        Calculate order progress - used by both compute and onchange.
+        Progress is computed once per order (and edited pallet) and shared by
+        its lines; in a pallet form the unsaved lines of the pallet are counted
+        instead of its saved ones.
+        """
+        progress_cache = {}
+        for line in self:
+            order = line.pallet_id.order_id
+            values = {}
+            if line.product_id and order:
+                # New id: the pallet is being edited in a form
+                pallet = line.pallet_id if not line.pallet_id.id else None
+                key = (order, pallet)
+                if key not in progress_cache:
+                    progress_cache[key] = order._get_pallet_progress(pallet)
+                values = progress_cache[key].get(line.product_id.id, {})
             
-            # Total palletized = current pallet (from form) + other pallets (from DB)
-            palletized_qty = current_pallet_subtotal + other_pallets_subtotal
-        
-        self.ordered_qty = ordered_qty
-        self.ordered_uom = ordered_uom
-        self.palletized_qty = palletized_qty
-        self.remaining_qty = max(0, ordered_qty - palletized_qty)
-        self.progress_percent = (palletized_qty / ordered_qty * 100) if ordered_qty > 0 else 0
-        self.is_complete = palletized_qty >= ordered_qty if ordered_qty > 0 else False
-        self.is_over = palletized_qty > ordered_qty if ordered_qty > 0 else False
+            line.ordered_qty = values.get('ordered_qty', 0.0)
+            line.ordered_uom = values.get('uom', '')
+            line.palletized_qty = values.get('palletized_qty', 0.0)
+            line.remaining_qty = values.get('remaining_qty', 0.0)
+            line.progress_percent = values.get('progress_percent', 0.0)
+            line.is_complete = values.get('is_complete', False)
+            line.is_over = values.get('is_over', False)
 
     @api.onchange('product_id', 'box_weight_kg', 'box_quantity')
     def _onchange_update_progress(self):
         """Update progress indicators in real-time as user types"""
         # Update all lines in the pallet (same product might appear multiple times)
         if self.pallet_id and self.pallet_id.line_ids:
-            for line in self.pallet_id.line_ids:
-                line._update_order_progress()
+            self.pallet_id.line_ids._update_order_progress()
         else:
             self._update_order_progress()
 
-    def get_barcode(self):
-        """Get barcode: customer code if exists, else product default_code"""
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.pallet_id._schedule_label_prerender()
+        lines._queue_packing_deltas()
+        return lines
+
+    def write(self, vals):
+        pallets = self.pallet_id
+        tracked = PACKING_LINE_FIELDS.intersection(vals)
+        if tracked:
+            self._queue_packing_deltas(sign=-1)
+        res = super().write(vals)
+        if tracked:
+            self._queue_packing_deltas()
+        if LABEL_LINE_FIELDS.intersection(vals):
+            (pallets | self.pallet_id)._schedule_label_prerender()
+        return res
+
+    def unlink(self):
+        pallets = self.pallet_id
+        self._queue_packing_deltas(sign=-1)
+        res = super().unlink()
+        pallets.exists()._schedule_label_prerender()
+        return res
+
+    def _queue_packing_deltas(self, sign=1):
+        """Add (sign=1) or remove (sign=-1) these lines in the live packing progress of their orders"""
+        SaleOrder = self.env['sale.order']
+        for line in self:
+            SaleOrder._queue_packing_delta(
+                line.order_id.id, line.product_id.id,
+                kg=sign * line.subtotal_kg, boxes=sign * line.box_quantity,
+            )
+
+    def _get_barcodes(self):
+        """Barcodes of all lines resolved in one query: {line_id: barcode}"""
+        codes = self.env['res.partner']._get_product_barcodes(
+            (line.pallet_id.partner_id.id, line.product_id.id) for line in self
+        )
+        return {
+            line.id: codes.get((line.pallet_id.partner_id.id, line.product_id.id), '')
+            for line in self
+        }
+
+    def get_barcode(self, barcodes=None):
+        """
+        Get barcode: customer code if exists, else product default_code.
+        `barcodes` is the result of _get_barcodes() prefetched for a whole print job.
+        """
         self.ensure_one()
-        partner = self.pallet_id.partner_id
-        if partner:
-            return partner.get_product_barcode(self.product_id)
-        return self.product_id.default_code or ''
+        if barcodes is None:
+            barcodes = self._get_barcodes()
+        return barcodes.get(self.id, '')
 
-    def get_barcode_image(self):
+    def get_barcode_image(self, barcodes=None):
         """Generate barcode as base64 data URI for PDF reports"""
         self.ensure_one()
-        barcode_value = self.get_barcode()
+        barcode_value = self.get_barcode(barcodes)
         if not barcode_value:
             return ''
         
         if BARCODE_AVAILABLE:
+            output_format = self.env['ir.config_parameter'].sudo().get_param(
+                'farm_management.barcode_format', 'png')
             try:
                 # Generate barcode using python-barcode library
-                buffer = BytesIO()
-                code = Code128(str(barcode_value), writer=ImageWriter())
-                code.write(buffer, options={
-                    'module_width': 0.3,
-                    'module_height': 8,
-                    'font_size': 8,
-                    'text_distance': 3,
-                    'quiet_zone': 2,
-                })
-                buffer.seek(0)
-                img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                return f'data:image/png;base64,{img_base64}'
+                return _barcode_data_uri(str(barcode_value), output_format)
             except Exception:
                 pass
         
         # Fallback: return empty (template will show code as text)
-        return ''
\ No newline at end of file
+        return ''
+
+
+class SaleOrderPalletLabelRequest(models.Model):
+    """User waiting for a pallet label that is being pre-rendered in the background"""
+    _name = 'sale.order.pallet.label.request'
+    _description = 'طلب طباعة ملصق باليت'
+
+    pallet_id = fields.Many2one(
+        'sale.order.pallet',
+        string='الباليت',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='المستخدم',
+        required=True,
+        ondelete='cascade',
+    )
+
+
+class ReportPalletLabel(models.AbstractModel):
+    """QWeb PDF pallet label: resolves the barcodes of all printed lines once"""
+    _name = 'report.farm_management.report_pallet_label'
+    _description = 'تقرير ملصق الباليت'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        pallets = self.env['sale.order.pallet'].browse(docids)
+        return {
+            'doc_ids': docids,
+            'doc_model': 'sale.order.pallet',
+            'docs': pallets,
+            'barcodes': pallets.line_ids._get_barcodes(),
+        }
+
+
+class SaleOrderPalletLabelStat(models.Model):
+    """Daily hit/miss counters of the rendered pallet label cache"""
+    _name = 'sale.order.pallet.label.stat'
+    _description = 'إحصائيات ذاكرة ملصقات الباليت'
+    _order = 'date desc'
+
+    date = fields.Date(
+        string='التاريخ',
+        required=True,
+        readonly=True,
+    )
+    hits = fields.Integer(
+        string='من الذاكرة',
+        readonly=True,
+    )
+    misses = fields.Integer(
+        string='تم توليدها',
+        readonly=True,
+    )
+    hit_rate = fields.Float(
+        string='نسبة الاستفادة (%)',
+        compute='_compute_hit_rate',
+    )
+
+    _sql_constraints = [
+        ('date_uniq', 'unique(date)', 'يوجد سجل إحصائيات لهذا التاريخ مسبقاً'),
+    ]
+
+    @api.depends('hits', 'misses')
+    def _compute_hit_rate(self):
+        for stat in self:
+            total = stat.hits + stat.misses
+            stat.hit_rate = (stat.hits / total * 100) if total else 0.0
+
+    @api.model
+    def _record(self, hits, misses):
+        """Add to today's counters in one statement, safe under concurrent prints"""
+        if not hits and not misses:
+            return
+        self.env.cr.execute("""
+            INSERT INTO sale_order_pallet_label_stat
+                   (date, hits, misses, create_uid, write_uid, create_date, write_date)
+            VALUES (CURRENT_DATE, %(hits)s, %(misses)s, %(uid)s, %(uid)s,
+                    NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (date) DO UPDATE
+               SET hits = sale_order_pallet_label_stat.hits + EXCLUDED.hits,
+                   misses = sale_order_pallet_label_stat.misses + EXCLUDED.misses,
+                   write_date = EXCLUDED.write_date
+        """, {'hits': hits, 'misses': misses, 'uid': self.env.uid})
+        self.invalidate_model(['hits', 'misses'])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived headless Chromium for pallet label rendering.
+
+Starting Chromium costs far more than rendering a label, so each Odoo process
+keeps one browser alive and reuses it across requests. Playwright's sync API
+is bound to the thread that started it, and in threaded mode every request
+runs on its own thread, so the browser is owned by one dedicated render
+thread per process: requests hand their render to it and wait for the
+result, one render at a time. The browser is recycled after a number of
+renders, when it crashes, and after a fork.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+try:
+    from playwright.sync_api import sync_playwright, Error as PlaywrightError
+    PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    PLAYWRIGHT_AVAILABLE = False
+    sync_playwright = None
+    PlaywrightError = Exception
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RENDERS = 200
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox']
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ChromiumPool:
+    """
+    One Playwright + Chromium instance owned by a render thread, recycled
+    after max_renders renders
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.playwright = None
+        self.browser = None
+        self.render_count = 0
+        self.tasks = queue.Queue()
+        self.thread = threading.Thread(
+            target=self._serve, name='pallet-label-browser', daemon=True,
+        )
+        self.thread.start()
+
+    # ========== Render thread ==========
+
+    def _serve(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self.close()
+                return
+            future, render, renders, max_renders = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._run(render, renders, max_renders))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _start(self):
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        self.render_count = 0
+        _logger.info("Started pallet label browser (pid %s)", self.pid)
+
+    def close(self):
+        """Close the browser and Playwright, ignoring errors from a dead browser"""
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception:
+                _logger.debug("Error closing pallet label browser", exc_info=True)
+        if self.playwright is not None:
+            try:
+                self.playwright.stop()
+            except Exception:
+                _logger.debug("Error stopping Playwright", exc_info=True)
+        self.browser = None
+        self.playwright = None
+        self.render_count = 0
+
+    def _ensure_browser(self, max_renders):
+        if self.browser is not None and (
+            not self.browser.is_connected() or self.render_count >= max_renders
+        ):
+            self.close()
+        if self.browser is None:
+            self._start()
+        return self.browser
+
+    def _run(self, render, renders, max_renders):
+        for attempt in (1, 2):
+            browser = self._ensure_browser(max_renders)
+            try:
+                context = browser.new_context(
+                    viewport={'width': 400, 'height': 100},
+                    device_scale_factor=2,  # 2x for high DPI quality
+                )
+            except PlaywrightError:
+                if attempt == 2:
+                    raise
+                _logger.warning("Pallet label browser is not responding, restarting it")
+                self.close()
+                continue
+            try:
+                result = render(context)
+                self.render_count += renders
+                return result
+            except PlaywrightError:
+                if attempt == 2 or browser.is_connected():
+                    raise
+                _logger.warning("Pallet label browser crashed, restarting it")
+                self.close()
+            finally:
+                try:
+                    context.close()
+                except Exception:
+                    pass
+
+    # ========== Caller API ==========
+
+    def run(self, render, renders=1, max_renders=DEFAULT_MAX_RENDERS):
+        """
+        Call render(context) on the render thread with a fresh browser context
+        of the shared browser, and return its result. `renders` is the number
+        of labels rendered, counted for recycling. If the browser died, it is
+        restarted and the render retried once.
+        """
+        future = Future()
+        self.tasks.put((future, render, renders, max_renders))
+        return future.result()
+
+    def stop(self):
+        """Ask the render thread to close the browser and exit"""
+        if self.thread.is_alive():
+            self.tasks.put(None)
+            self.thread.join(timeout=10)
+
+
+def get_pool():
+    """Return the browser pool of the current process, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (_pool.pid != os.getpid() or not _pool.thread.is_alive()):
+            # Inherited through fork (the browser belongs to the parent
+            # process and the render thread does not exist here), or dead
+            _pool = None
+        if _pool is None:
+            _pool = ChromiumPool()
+        return _pool
+
+
+@atexit.register
+def _close_pool():
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.stop()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Embedded font for the standalone pallet label documents.
+
+The label font is read from the local disk, subset to the characters a label
+can use (Latin, Arabic and Arabic presentation forms) and inlined as a data
+URI @font-face, so rendering never waits for the network and does not depend
+on the fonts installed next to the renderer. The subset is built once per
+process.
+"""
+
+import base64
+import functools
+import io
+import logging
+import os
+
+from markupsafe import Markup
+
+try:
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTFont
+    FONTTOOLS_AVAILABLE = True
+except ImportError:
+    FONTTOOLS_AVAILABLE = False
+
+_logger = logging.getLogger(__name__)
+
+FONT_FAMILY = 'PalletLabel'
+
+# (regular, bold) font files tried in order when none is configured
+FONT_CANDIDATES = (
+    ('/usr/share/fonts/truetype/noto/NotoSansArabic-Regular.ttf',
+     '/usr/share/fonts/truetype/noto/NotoSansArabic-Bold.ttf'),
+    ('/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf',
+     '/usr/share/fonts/truetype/noto/NotoNaskhArabic-Bold.ttf'),
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+     '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+)
+
+LABEL_UNICODES = [
+    *range(0x0020, 0x007F),  # Basic Latin
+    *range(0x00A0, 0x0100),  # Latin-1 (×, ...)
+    *range(0x0600, 0x0700),  # Arabic
+    *range(0x2010, 0x2030),  # Dashes, quotes
+    *range(0xFB50, 0xFE00),  # Arabic Presentation Forms-A
+    *range(0xFE70, 0xFF00),  # Arabic Presentation Forms-B
+]
+
+
+def _find_fonts(regular_path=None, bold_path=None):
+    if regular_path:
+        return regular_path, bold_path
+    for regular, bold in FONT_CANDIDATES:
+        if os.path.isfile(regular):
+            return regular, bold if os.path.isfile(bold) else None
+    return None, None
+
+
+def _subset_font(path):
+    """TrueType data of the font at `path` reduced to the label characters"""
+    font = TTFont(path)
+    options = font_subset.Options()
+    options.layout_features = ['*']  # Keep Arabic shaping (init/medi/fina, ligatures)
+    options.notdef_outline = True
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=LABEL_UNICODES)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font.save(output)
+    return output.getvalue()
+
+
+@functools.lru_cache(maxsize=4)
+def get_font_face_css(regular_path=None, bold_path=None):
+    """
+    @font-face rules embedding the subset label font, or an empty string when
+    no font file or fontTools is available (the system fonts are used then).
+    """
+    if not FONTTOOLS_AVAILABLE:
+        return Markup('')
+    regular_path, bold_path = _find_fonts(regular_path, bold_path)
+    if not regular_path:
+        return Markup('')
+
+    rules = []
+    for path, weight in ((regular_path, 'normal'), (bold_path, 'bold')):
+        if not path:
+            continue
+        try:
+            data = _subset_font(path)
+        except Exception:
+            _logger.warning("Could not embed pallet label font %s", path, exc_info=True)
+            continue
+        rules.append(
+            "@font-face { font-family: '%s'; font-weight: %s; "
+            "src: url(data:font/ttf;base64,%s) format('truetype'); }" % (
+                FONT_FAMILY, weight, base64.b64encode(data).decode('ascii'))
+        )
+    return Markup('\n'.join(rules))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Printer-native pallet labels for thermal roll printers.
+
+Builds ZPL (Zebra) or ESC/POS (receipt printers) from the label data of
+sale.order.pallet (see SaleOrderPallet._get_label_data) instead of
+rendering HTML to images. Barcodes are drawn by the printer itself.
+"""
+
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    ARABIC_SHAPING_AVAILABLE = True
+except ImportError:
+    ARABIC_SHAPING_AVAILABLE = False
+
+DEFAULT_DPI = 203
+LABEL_WIDTH_MM = 100
+
+
+# ========== ZPL ==========
+
+def _zpl_text(text):
+    """Escape text for a ^FH field (the '_' hex escape character and ZPL command prefixes)"""
+    text = str(text or '')
+    for char in ('_', '^', '~'):
+        text = text.replace(char, '_%02X' % ord(char))
+    return text
+
+
+def build_zpl(labels, dpi=DEFAULT_DPI, font=None):
+    """
+    Return one ZPL document (^XA ... ^XZ per label) for the given label data.
+
+    :param labels: list of dicts from SaleOrderPallet._get_label_data()
+    :param dpi: printer resolution in dots per inch (203, 300 or 600)
+    :param font: optional printer font file (e.g. 'E:TT0003M_.TTF') with Arabic
+        glyphs; the built-in font 0 is used otherwise
+    """
+    dots_per_mm = dpi / 25.4
+    width = int(LABEL_WIDTH_MM * dots_per_mm)
+    margin = int(3 * dots_per_mm)
+    text_width = width - 2 * margin
+
+    def scaled(size):
+        # Sizes are given for 203 dpi
+        return max(int(size * dpi / DEFAULT_DPI), 1)
+
+    def font_cmd(height):
+        if font:
+            return '^A@N,%d,%d,%s' % (height, height, font)
+        return '^A0N,%d,%d' % (height, height)
+
+    documents = []
+    for label in labels:
+        commands = ['^XA', '^CI28', '^PW%d' % width]
+        if font:
+            # Bidirectional text and Arabic shaping (firmware V60.14+)
+            commands.append('^PA0,1,1,0')
+        y = margin
+
+        def text(value, height, align='R', lines=1):
+            nonlocal y
+            commands.append('^FO%d,%d%s^FB%d,%d,0,%s^FH^FD%s^FS' % (
+                margin, y, font_cmd(scaled(height)), text_width, lines, align, _zpl_text(value),
+            ))
+            y += scaled(height) * lines + scaled(8)
+
+        def rule(thickness=2):
+            nonlocal y
+            commands.append('^FO%d,%d^GB%d,%d,%d^FS' % (
+                margin, y, text_width, scaled(thickness), scaled(thickness),
+            ))
+            y += scaled(thickness) + scaled(10)
+
+        # Header
+        text(label['company_name'], 32, align='C')
+        rule()
+
+        # Order info
+        text('%s: %s' % ('طلب رقم', label['order_name']), 26)
+        text(label['pallet_name'], 30, align='L')
+
+        # Customer
+        text('التسليم إلى:', 22)
+        text(label['partner_name'], 30)
+        if label['partner_address']:
+            text(label['partner_address'], 22)
+        rule()
+
+        # Products
+        for line in label['lines']:
+            text(line['product_name'], 26, lines=2)
+            text('%.1f كجم × %s = %.1f كجم' % (
+                line['box_weight_kg'], line['box_quantity'], line['subtotal_kg'],
+            ), 24)
+            if line['barcode']:
+                barcode_height = scaled(70)
+                commands.append('^FO%d,%d^BY%d^BCN,%d,Y,N,N,A^FH^FD%s^FS' % (
+                    margin + scaled(40), y, scaled(2), barcode_height, _zpl_text(line['barcode']),
+                ))
+                y += barcode_height + scaled(40)
+            rule(1)
+
+        # Totals
+        text('%s: %s' % ('إجمالي الصناديق', label['total_boxes']), 28)
+        text('%s: %.1f كجم' % ('إجمالي الوزن', label['total_kg']), 28)
+        rule(1)
+
+        # Footer
+        text('تاريخ الطباعة: %s' % label['printed_at'], 20, align='C')
+
+        commands.insert(3, '^LL%d' % (y + margin))
+        commands.append('^XZ')
+        documents.append('\n'.join(commands))
+
+    return '\n'.join(documents) + '\n'
+
+
+# ========== ESC/POS ==========
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+
+def _escpos_text(value, encoding):
+    """Shape and reorder Arabic for printers that print left to right, then encode"""
+    value = str(value or '')
+    if ARABIC_SHAPING_AVAILABLE:
+        value = get_display(arabic_reshaper.reshape(value))
+    return value.encode(encoding, errors='replace')
+
+
+def build_escpos(labels, encoding='cp1256', code_table=50):
+    """
+    Return ESC/POS bytes for the given label data, with a cut after each label.
+
+    :param encoding: Python codec matching the printer code table
+    :param code_table: ESC t code page number of `encoding` on the printer
+    """
+    out = bytearray()
+    out += ESC + b'@'                       # Initialize
+    out += ESC + b't' + bytes([code_table])  # Character code table
+
+    def line(value=b'', align=0, bold=False, size=0):
+        nonlocal out
+        out += ESC + b'a' + bytes([align])          # 0 left, 1 center, 2 right
+        out += ESC + b'E' + bytes([1 if bold else 0])
+        out += GS + b'!' + bytes([size])            # 0x11 double width and height
+        out += value if isinstance(value, bytes) else _escpos_text(value, encoding)
+        out += b'\n'
+
+    def rule(char='-'):
+        line((char * 42).encode('ascii'))
+
+    for label in labels:
+        line(label['company_name'], align=1, bold=True, size=0x11)
+        rule('=')
+        line('%s: %s' % ('طلب رقم', label['order_name']), align=2, bold=True)
+        line(label['pallet_name'], align=2, size=0x11)
+        line('التسليم إلى: %s' % label['partner_name'], align=2, bold=True)
+        if label['partner_address']:
+            line(label['partner_address'], align=2)
+        rule()
+
+        for pallet_line in label['lines']:
+            line(pallet_line['product_name'], align=2, bold=True)
+            line('%.1f كجم × %s = %.1f كجم' % (
+                pallet_line['box_weight_kg'], pallet_line['box_quantity'], pallet_line['subtotal_kg'],
+            ), align=2)
+            if pallet_line['barcode']:
+                code = pallet_line['barcode'].encode('ascii', errors='replace')[:253]
+                out += ESC + b'a' + bytes([1])
+                out += GS + b'h' + bytes([80])   # Barcode height (dots)
+                out += GS + b'w' + bytes([2])    # Module width
+                out += GS + b'H' + bytes([2])    # Human readable text below
+                data = b'{B' + code
+                out += GS + b'k' + bytes([73, len(data)]) + data  # CODE128
+                out += b'\n'
+            rule()
+
+        line('%s: %s' % ('إجمالي الصناديق', label['total_boxes']), align=2, bold=True)
+        line('%s: %.1f كجم' % ('إجمالي الوزن', label['total_kg']), align=2, bold=True)
+        rule()
+        line('تاريخ الطباعة: %s' % label['printed_at'], align=1)
+
+        out += ESC + b'd' + bytes([4])       # Feed 4 lines
+        out += GS + b'V' + bytes([66, 0])    # Partial cut
+
+    return bytes(out)
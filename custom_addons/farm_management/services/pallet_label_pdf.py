@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal streaming PDF writer for pallet labels.
+
+Each label image becomes its own page, as wide as the label roll and as tall
+as the label. PNG image data is embedded as-is (PNG IDAT is a zlib stream
+that PDF reads with FlateDecode and the PNG predictor), so opaque labels are
+never decoded. The document is produced piece by piece so it can be sent to
+the client while the next labels are rendered.
+"""
+
+import io
+import struct
+import zlib
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+LABEL_WIDTH_MM = 100
+LABEL_WIDTH_PT = LABEL_WIDTH_MM / 25.4 * 72  # 100 mm roll
+BILEVEL_THRESHOLD = 160
+
+# PNG color type -> (components, PDF color space)
+PNG_COLOR_TYPES = {
+    0: (1, b'/DeviceGray'),
+    2: (3, b'/DeviceRGB'),
+    3: (1, None),  # Indexed, color space built from PLTE
+}
+
+
+def _parse_png(data):
+    """Return (width, height, bit_depth, color_type, interlace, palette, idat)"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG image")
+    pos = len(PNG_SIGNATURE)
+    header = None
+    palette = None
+    idat = []
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length  # length, type, data, crc
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif chunk_type == b'PLTE':
+            palette = chunk
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+    if header is None or not idat:
+        raise ValueError("Incomplete PNG image")
+    width, height, bit_depth, color_type, _compression, _filter, interlace = header
+    return width, height, bit_depth, color_type, interlace, palette, b''.join(idat)
+
+
+def _image_xobject(data):
+    """
+    Return (width, height, dictionary, stream) of an image XObject for PNG data.
+    Opaque, non-interlaced PNGs are passed through; images with alpha (or
+    interlacing) are flattened on white, which needs Pillow.
+    """
+    width, height, bit_depth, color_type, interlace, palette, idat = _parse_png(data)
+
+    if color_type in PNG_COLOR_TYPES and not interlace and bit_depth <= 8:
+        colors, color_space = PNG_COLOR_TYPES[color_type]
+        if color_space is None:
+            color_space = b'[/Indexed /DeviceRGB %d <%s>]' % (
+                len(palette) // 3 - 1, palette.hex().encode('ascii'))
+        dictionary = (
+            b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+            b'/BitsPerComponent %d /Filter /FlateDecode '
+            b'/DecodeParms << /Predictor 15 /Colors %d /BitsPerComponent %d /Columns %d >>'
+        ) % (width, height, color_space, bit_depth, colors, bit_depth, width)
+        return width, height, dictionary, idat
+
+    if not PIL_AVAILABLE:
+        raise ValueError("Pillow is required for PNG color type %s" % color_type)
+    image = Image.open(io.BytesIO(data))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    else:
+        image = image.convert('RGB')
+    dictionary = (
+        b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+        b'/BitsPerComponent 8 /Filter /FlateDecode'
+    ) % image.size
+    return image.width, image.height, dictionary, zlib.compress(image.tobytes(), 6)
+
+
+def to_bilevel_png(data, dpi=203, dither=False):
+    """
+    Convert a label screenshot to a 1-bit PNG at the printer resolution, for
+    monochrome thermal printers. Thresholding keeps text and barcodes crisp;
+    dithering (Floyd-Steinberg) suits labels with photos or logos.
+    The result is a gray 1-bit PNG that add_page() embeds without decoding.
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, 'white')
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L')
+
+    width = round(LABEL_WIDTH_MM / 25.4 * dpi)
+    height = max(round(image.height * width / image.width), 1)
+    image = image.resize((width, height), Image.LANCZOS)
+
+    if dither:
+        image = image.convert('1')
+    else:
+        image = image.point(lambda value: 255 if value >= BILEVEL_THRESHOLD else 0).convert('1', dither=Image.NONE)
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+class StreamingPdfWriter:
+    """
+    Writes a PDF incrementally: header(), add_page() per label, then close().
+    Each call returns the bytes to send. Object 1 is the catalog and object 2
+    the page tree, both written last once all pages are known.
+    """
+
+    def __init__(self, page_width=LABEL_WIDTH_PT):
+        self.page_width = page_width
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def _write(self, chunk):
+        self.offset += len(chunk)
+        return chunk
+
+    def _object(self, obj_id, dictionary, stream=None):
+        self.offsets[obj_id] = self.offset
+        if stream is None:
+            body = b'%d 0 obj\n<< %s >>\nendobj\n' % (obj_id, dictionary)
+        else:
+            body = b'%d 0 obj\n<< %s /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (
+                obj_id, dictionary, len(stream), stream)
+        return self._write(body)
+
+    def _reserve(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def header(self):
+        return self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add_page(self, png_data):
+        """Add one label image as a page of the roll width and matching height"""
+        width, height, dictionary, stream = _image_xobject(png_data)
+        page_height = self.page_width * height / width
+
+        image_id = self._reserve()
+        content_id = self._reserve()
+        page_id = self._reserve()
+        self.page_ids.append(page_id)
+
+        content = b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % (self.page_width, page_height)
+        return b''.join([
+            self._object(image_id, dictionary, stream),
+            self._object(content_id, b'', content),
+            self._object(page_id, (
+                b'/Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+                b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R'
+            ) % (self.page_width, page_height, image_id, content_id)),
+        ])
+
+    def close(self):
+        """Write the page tree, catalog, cross-reference table and trailer"""
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        chunks = [
+            self._object(2, b'/Type /Pages /Kids [%s] /Count %d' % (kids, len(self.page_ids))),
+            self._object(1, b'/Type /Catalog /Pages 2 0 R'),
+        ]
+        xref_offset = self.offset
+        xref = [b'xref\n0 %d\n' % self.next_id, b'0000000000 65535 f \n']
+        xref.extend(b'%010d 00000 n \n' % self.offsets[obj_id] for obj_id in range(1, self.next_id))
+        xref.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_id, xref_offset))
+        chunks.append(self._write(b''.join(xref)))
+        return b''.join(chunks)
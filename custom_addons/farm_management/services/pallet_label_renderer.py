@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Pallet label rendering pipeline.
+
+Renders pallet labels from HTML to images with a shared headless Chromium
+(Playwright), with wkhtmltoimage as fallback. Rendered labels are cached as
+attachments, keyed by a hash of the label content, so unchanged pallets are
+not rendered again. Builds a PDF with exact image dimensions for true roll
+printing, either as one stitched page or streamed with one page per label.
+
+Everything here works from the environment of the pallets it is given, so it
+is used both by the label controller and by the background pre-render job.
+"""
+
+import datetime
+import functools
+import io
+import logging
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo.tools.image import image_data_uri
+
+try:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import ImageReader
+    from PIL import Image
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+from .pallet_label_browser import PLAYWRIGHT_AVAILABLE, DEFAULT_MAX_RENDERS, get_pool
+from .pallet_label_fonts import get_font_face_css
+from .pallet_label_formats import DEFAULT_DPI, build_escpos, build_zpl
+from .pallet_label_pdf import PIL_AVAILABLE, StreamingPdfWriter, to_bilevel_png
+
+_logger = logging.getLogger(__name__)
+
+# Parallel wkhtmltoimage processes when the shared browser is not available
+WKHTMLTOIMAGE_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class PalletLabelRenderer:
+
+    # ========== Printer-native labels ==========
+
+    def build_native_labels(self, pallets, output):
+        """
+        Return the labels as ZPL or ESC/POS bytes for thermal roll printers.
+        Barcodes are printed by the printer, so no HTML or image rendering is needed.
+        """
+        labels = pallets._get_label_data()
+        params = pallets.env['ir.config_parameter'].sudo()
+        if output == 'zpl':
+            dpi = int(params.get_param('farm_management.label_printer_dpi', DEFAULT_DPI) or DEFAULT_DPI)
+            font = params.get_param('farm_management.zpl_font') or None
+            return build_zpl(labels, dpi=dpi, font=font).encode('utf-8')
+        encoding = params.get_param('farm_management.escpos_encoding') or 'cp1256'
+        code_table = int(params.get_param('farm_management.escpos_code_table', 50) or 50)
+        return build_escpos(labels, encoding=encoding, code_table=code_table)
+
+    # ========== PDF output ==========
+
+    def generate_label_pages(self, pallet_ids, cached, documents, max_renders, store, convert=None):
+        """
+        Yield the PDF in pieces: the header with the first page, one piece per
+        following page, then the trailer. Does not use any cursor; new images
+        are handed to store({pallet_id: image}) at the end.
+        """
+        writer = StreamingPdfWriter()
+        pending = writer.header()
+        rendered = {}
+        for pallet_id, image, is_new in self.iter_label_images(
+            pallet_ids, cached, documents, max_renders, convert,
+        ):
+            if is_new:
+                rendered[pallet_id] = image
+            yield pending + writer.add_page(image)
+            pending = b''
+        if not writer.page_ids:
+            raise ValueError("No pallet label could be rendered")
+        store(rendered)
+        yield writer.close()
+
+    def generate_image_pdf(self, pallets, batch=False, color=None):
+        """
+        Generate PDF where each page is an image of the rendered label.
+        Page height matches image height for true roll printing.
+        Labels come from the rendered label cache when the pallet is unchanged.
+        """
+        output_format, convert = self.get_label_raster(pallets.env, color)
+        keys, cached, documents = self.prepare_label_images(pallets, batch=batch, output_format=output_format)
+
+        images = []
+        rendered = {}
+        for pallet_id, image, is_new in self.iter_label_images(
+            pallets.ids, cached, documents, self.get_browser_max_renders(pallets.env), convert,
+        ):
+            images.append(image)
+            if is_new:
+                rendered[pallet_id] = image
+
+        if not images:
+            return None
+
+        pallets._store_label_images(rendered, keys, output_format)
+        return self._create_pdf_from_images(images)
+
+    def cache_label_images(self, pallets):
+        """
+        Render and cache the labels of the pallets that are not cached yet
+        (background pre-render). Returns the new images {pallet_id: image}.
+        """
+        output_format, convert = self.get_label_raster(pallets.env)
+        keys, _cached, documents = self.prepare_label_images(
+            pallets, batch=True, output_format=output_format, record_stats=False,
+        )
+        rendered = {
+            pallet_id: image
+            for pallet_id, image, is_new in self.iter_label_images(
+                pallets.ids, {}, documents, self.get_browser_max_renders(pallets.env), convert,
+            )
+            if is_new
+        }
+        pallets._store_label_images(rendered, keys, output_format)
+        return rendered
+
+    # ========== Pipeline ==========
+
+    def prepare_label_images(self, pallets, batch=False, output_format='png', record_stats=True):
+        """
+        Look the labels up in the rendered label cache and render the HTML of
+        the others. Returns (keys, cached, documents): the cache keys, the
+        cached images {pallet_id: image} and the documents to render as
+        [(html, pallet_ids)], one per pallet or a single one with batch.
+        Uses the environment of `pallets`. The print date is taken once, so
+        the rendered labels show the date their cache key holds.
+        """
+        barcodes = pallets.line_ids._get_barcodes()
+        print_date = pallets._get_label_print_date()
+        keys = pallets._get_label_cache_keys(output_format, barcodes=barcodes, print_date=print_date)
+        cached = pallets._get_cached_label_images(keys, output_format)
+        missing = pallets.filtered(lambda p: p.id not in cached)
+        if record_stats:
+            pallets.env['sale.order.pallet.label.stat']._record(len(cached), len(missing))
+
+        # wkhtmltoimage cannot split a batch document into labels
+        if batch and PLAYWRIGHT_AVAILABLE and len(missing) > 1:
+            documents = [(
+                self.render_label_html(
+                    missing, template='farm_management.report_pallet_label_standalone_batch',
+                    barcodes=barcodes, print_date=print_date,
+                ),
+                missing.ids,
+            )]
+        else:
+            documents = [
+                (self.render_label_html(pallet, barcodes=barcodes, print_date=print_date), [pallet.id])
+                for pallet in missing
+            ]
+        documents = [(html, doc_ids) for html, doc_ids in documents if html]
+        return keys, cached, documents
+
+    def get_label_raster(self, env, color=None):
+        """
+        Return (output_format, convert) for the label images: the color
+        screenshots as they are, or a conversion to 1-bit images at the
+        printer resolution for monochrome thermal printers. output_format is
+        part of the label cache key.
+        """
+        params = env['ir.config_parameter'].sudo()
+        color = color or params.get_param('farm_management.label_color_mode') or 'color'
+        if color not in ('mono', 'mono_dither') or not PIL_AVAILABLE:
+            return 'png', None
+        dpi = int(params.get_param('farm_management.label_printer_dpi', DEFAULT_DPI) or DEFAULT_DPI)
+        return f'{color}-{dpi}', functools.partial(to_bilevel_png, dpi=dpi, dither=color == 'mono_dither')
+
+    def get_browser_max_renders(self, env):
+        return int(env['ir.config_parameter'].sudo().get_param(
+            'farm_management.label_browser_max_renders', DEFAULT_MAX_RENDERS
+        ) or DEFAULT_MAX_RENDERS)
+
+    def iter_label_images(self, pallet_ids, cached, documents, max_renders, convert=None):
+        """
+        Yield (pallet_id, image, is_new) in pallet order, rendering each
+        document when its first pallet comes up. is_new is set for images
+        that map to exactly one label and can be cached. `convert` is applied
+        to newly rendered images.
+        """
+        to_render = {pallet_id for _html, doc_ids in documents for pallet_id in doc_ids}
+        document_images = self._iter_document_images(documents, max_renders)
+        rendered = {}
+        for pallet_id in pallet_ids:
+            if pallet_id in cached:
+                yield pallet_id, cached[pallet_id], False
+                continue
+            if pallet_id not in to_render:
+                continue
+            # Documents come in pallet order: the next one holds this pallet
+            while pallet_id not in rendered:
+                doc_ids, images = next(document_images)
+                if convert:
+                    images = [convert(image) for image in images]
+                if len(images) == len(doc_ids):
+                    rendered.update((doc_id, (image, True)) for doc_id, image in zip(doc_ids, images))
+                else:
+                    # Labels could not be told apart: keep the output, do not cache it
+                    rendered.update((doc_id, None) for doc_id in doc_ids)
+                    for image in images:
+                        yield pallet_id, image, False
+            if rendered[pallet_id]:
+                image, is_new = rendered[pallet_id]
+                yield pallet_id, image, is_new
+
+    def _iter_document_images(self, documents, max_renders):
+        """
+        Yield (pallet_ids, images) for each document, in order. Documents go
+        through the shared browser one after the other; without it, they are
+        rendered by a small pool of wkhtmltoimage processes in parallel.
+        """
+        if PLAYWRIGHT_AVAILABLE:
+            for html, doc_ids in documents:
+                yield doc_ids, self._render_html_to_images(html, len(doc_ids), max_renders)
+            return
+        if not documents:
+            return
+        with ThreadPoolExecutor(max_workers=min(WKHTMLTOIMAGE_WORKERS, len(documents))) as executor:
+            # map() starts all renders now and returns the results in order
+            images = executor.map(self._render_with_wkhtmltoimage_safe, [html for html, _doc_ids in documents])
+            for (_html, doc_ids), image in zip(documents, images):
+                yield doc_ids, [image] if image else []
+
+    def _render_html_to_images(self, html, count, max_renders):
+        """PNG images of the label frames of one document, wkhtmltoimage as fallback"""
+        if PLAYWRIGHT_AVAILABLE:
+            try:
+                return get_pool().run(
+                    lambda context: self._screenshot_label_frames(context.new_page(), html),
+                    renders=count, max_renders=max_renders,
+                )
+            except Exception as e:
+                _logger.warning("Playwright rendering failed, trying wkhtmltoimage: %s", e)
+        image = self._render_with_wkhtmltoimage_safe(html)
+        return [image] if image else []
+
+    def _screenshot_label_frames(self, page, html):
+        """Load the label document in the page and return one PNG per label frame"""
+        # Start with small viewport to avoid min-height issues
+        page.set_viewport_size({'width': 400, 'height': 100})
+        page.set_content(html, wait_until='load')
+
+        # Wait for fonts to load instead of a fixed delay
+        page.evaluate('() => document.fonts.ready.then(() => true)')
+
+        # Resize viewport to the tallest label so each one is captured whole
+        frames = page.locator('.label-frame')
+        heights = frames.evaluate_all('(els) => els.map((el) => el.offsetHeight)')
+        if not heights:
+            return []
+        page.set_viewport_size({'width': 400, 'height': max(max(heights), 1)})
+
+        return [
+            frames.nth(index).screenshot(type='png')
+            for index in range(len(heights))
+        ]
+
+    def _render_with_wkhtmltoimage_safe(self, html):
+        try:
+            return self._render_with_wkhtmltoimage(html)
+        except Exception as e:
+            _logger.exception("Error rendering pallet label with wkhtmltoimage: %s", e)
+            return None
+
+    def _render_with_wkhtmltoimage(self, html):
+        """
+        Fallback: Render HTML to PNG using wkhtmltoimage.
+        The document is passed on stdin and the image read from stdout.
+        """
+        cmd = [
+            'wkhtmltoimage',
+            '--width', '400',
+            '--quality', '95',
+            '--disable-smart-width',
+            '--encoding', 'utf-8',
+            '--format', 'png',
+            '--quiet',
+            '-',
+            '-',
+        ]
+
+        result = subprocess.run(cmd, input=str(html).encode('utf-8'), capture_output=True, timeout=30)
+
+        if result.returncode != 0 or not result.stdout:
+            _logger.warning("wkhtmltoimage failed: %s", result.stderr.decode('utf-8', errors='ignore'))
+            return None
+
+        return result.stdout
+
+    # ========== HTML ==========
+
+    def render_label_html(self, pallet, template='farm_management.report_pallet_label_standalone', barcodes=None,
+                          print_date=None):
+        """
+        Render the pallet label QWeb template to HTML string.
+        `pallet` may hold several pallets for the batch template.
+        `barcodes` are the line barcodes prefetched for the whole print job.
+        `print_date` is the date printed on the label, part of its cache key.
+        The document is self-contained: inline style, embedded label font and
+        images as data URIs, so rendering needs no network access.
+        """
+        try:
+            params = pallet.env['ir.config_parameter'].sudo()
+            values = {
+                'docs': pallet,
+                'pallet': pallet,
+                'context_timestamp': lambda dt: dt,
+                'datetime': datetime,
+                'print_date': print_date or pallet._get_label_print_date(),
+                'image_data_uri': self._image_to_data_uri,
+                'barcodes': barcodes if barcodes is not None else pallet.line_ids._get_barcodes(),
+                'label_font_css': get_font_face_css(
+                    params.get_param('farm_management.label_font_path') or None,
+                    params.get_param('farm_management.label_font_bold_path') or None,
+                ),
+            }
+            return pallet.env['ir.qweb']._render(template, values)
+        except Exception as e:
+            _logger.exception("Error rendering label HTML: %s", e)
+            return None
+
+    def _image_to_data_uri(self, image_data):
+        """Convert a base64 image field value to a data URI for embedding in HTML."""
+        if not image_data:
+            return ''
+        try:
+            return image_data_uri(image_data)
+        except Exception:
+            return ''
+
+    def _create_pdf_from_images(self, images):
+        """
+        Create a single-page PDF with all images stitched vertically.
+        Adds padding between each label for visual separation.
+        Ideal for continuous roll printing.
+        1-bit labels stay 1-bit and are embedded as a bilevel image.
+        """
+        if not REPORTLAB_AVAILABLE:
+            return None
+        try:
+            # Padding between images (in pixels)
+            PADDING = 40
+
+            # Open all images and get dimensions
+            pil_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in images]
+
+            # Calculate combined dimensions
+            width = max(img.width for img in pil_images)
+            total_height = sum(img.height for img in pil_images) + (PADDING * (len(pil_images) - 1))
+
+            # Create combined image with white background
+            bilevel = all(img.mode == '1' for img in pil_images)
+            combined = Image.new('1' if bilevel else 'RGB', (width, total_height), 1 if bilevel else 'white')
+
+            # Paste each image with padding
+            y_offset = 0
+            for img in pil_images:
+                combined.paste(img, (0, y_offset))
+                y_offset += img.height + PADDING
+
+            if bilevel:
+                combined_bytes = io.BytesIO()
+                combined.save(combined_bytes, format='PNG', optimize=True)
+                writer = StreamingPdfWriter()
+                return writer.header() + writer.add_page(combined_bytes.getvalue()) + writer.close()
+
+            # Create single-page PDF
+            output = io.BytesIO()
+            c = canvas.Canvas(output, pagesize=(width, total_height))
+
+            combined_bytes = io.BytesIO()
+            combined.save(combined_bytes, format='PNG')
+            combined_bytes.seek(0)
+
+            c.drawImage(ImageReader(combined_bytes), 0, 0, width, total_height)
+            c.save()
+
+            return output.getvalue()
+
+        except Exception as e:
+            _logger.exception("Error creating PDF from images: %s", e)
+            return None
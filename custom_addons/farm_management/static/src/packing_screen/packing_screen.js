@@ -0,0 +1,135 @@
+/** @odoo-module **/
+
+import { Component, onWillStart, onWillUnmount, useState } from "@odoo/owl";
+import { registry } from "@web/core/registry";
+import { useService } from "@web/core/utils/hooks";
+import { standardActionServiceProps } from "@web/webclient/actions/action_service";
+
+const CHANNEL_PREFIX = "farm_packing_order_";
+const NOTIFICATION_TYPE = "farm_management.packing_progress";
+
+/**
+ * Live packing-station progress of a sale order.
+ *
+ * The initial state is read once; afterwards the screen only applies the
+ * progress deltas pushed on the order's bus channel when pallet lines are
+ * created, changed or deleted. After a reconnection the state is read again,
+ * since deltas sent meanwhile were missed.
+ */
+export class PackingScreen extends Component {
+    static template = "farm_management.PackingScreen";
+    static props = { ...standardActionServiceProps };
+
+    setup() {
+        this.orm = useService("orm");
+        this.busService = useService("bus_service");
+        this.actionService = useService("action");
+        this.orderId = this.props.action.params?.order_id || this.props.action.context?.active_id;
+        this.channel = `${CHANNEL_PREFIX}${this.orderId}`;
+        this.state = useState({
+            loaded: false,
+            orderName: "",
+            partnerName: "",
+            palletCount: 0,
+            products: [],
+            lastUpdate: null,
+        });
+
+        this.onProgress = this.onProgress.bind(this);
+        this.onReconnect = this.load.bind(this);
+
+        onWillStart(async () => {
+            await this.load();
+            this.busService.addChannel(this.channel);
+            this.busService.subscribe(NOTIFICATION_TYPE, this.onProgress);
+            this.busService.addEventListener("reconnect", this.onReconnect);
+        });
+        onWillUnmount(() => {
+            this.busService.unsubscribe(NOTIFICATION_TYPE, this.onProgress);
+            this.busService.removeEventListener("reconnect", this.onReconnect);
+            this.busService.deleteChannel(this.channel);
+        });
+    }
+
+    async load() {
+        const data = await this.orm.call("sale.order", "get_packing_screen_data", [[this.orderId]]);
+        Object.assign(this.state, {
+            loaded: true,
+            orderName: data.order_name,
+            partnerName: data.partner_name,
+            palletCount: data.pallet_count,
+            products: data.products,
+            lastUpdate: new Date(),
+        });
+    }
+
+    onProgress(payload) {
+        if (payload.order_id !== this.orderId) {
+            return;
+        }
+        this.state.palletCount += payload.pallets;
+        for (const delta of payload.lines) {
+            let product = this.state.products.find((p) => p.product_id === delta.product_id);
+            if (!product) {
+                product = {
+                    product_id: delta.product_id,
+                    product_name: delta.product_name,
+                    ordered_qty: 0,
+                    uom: "",
+                    palletized_qty: 0,
+                    boxes: 0,
+                };
+                this.state.products.push(product);
+                product = this.state.products[this.state.products.length - 1];
+            }
+            product.palletized_qty += delta.kg;
+            product.boxes += delta.boxes;
+        }
+        this.state.lastUpdate = new Date();
+    }
+
+    remaining(product) {
+        return Math.max(0, product.ordered_qty - product.palletized_qty);
+    }
+
+    progress(product) {
+        return product.ordered_qty > 0 ? (product.palletized_qty / product.ordered_qty) * 100 : 0;
+    }
+
+    progressClass(product) {
+        if (product.ordered_qty > 0 && product.palletized_qty > product.ordered_qty) {
+            return "bg-danger";
+        }
+        if (product.ordered_qty > 0 && product.palletized_qty >= product.ordered_qty) {
+            return "bg-success";
+        }
+        return "bg-info";
+    }
+
+    get totalKg() {
+        return this.state.products.reduce((total, p) => total + p.palletized_qty, 0);
+    }
+
+    get totalBoxes() {
+        return this.state.products.reduce((total, p) => total + p.boxes, 0);
+    }
+
+    formatNumber(value) {
+        return value.toFixed(1);
+    }
+
+    get lastUpdateLabel() {
+        return this.state.lastUpdate ? this.state.lastUpdate.toLocaleTimeString() : "";
+    }
+
+    openOrder() {
+        this.actionService.doAction({
+            type: "ir.actions.act_window",
+            res_model: "sale.order",
+            res_id: this.orderId,
+            views: [[false, "form"]],
+        });
+    }
+}
+
+registry.category("actions").add("farm_management.packing_screen", PackingScreen);
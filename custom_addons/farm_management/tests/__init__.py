@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_harvest_cumulative
+from . import test_hierarchy_rename
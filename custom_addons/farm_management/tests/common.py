@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests.common import TransactionCase
+
+
+class FarmHierarchyCommon(TransactionCase):
+    """Builds farm → sector → unit → house trees with batched creates"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Create the analytic accounts inline, never through a background job
+        cls.env['ir.config_parameter'].sudo().set_param(
+            'farm_management.house_analytic_async_threshold', 0)
+
+    @classmethod
+    def _create_farm(cls, name, sectors=1, units=1, houses=1, area=100.0):
+        """Farm with sectors × units × houses houses, each of the given area"""
+        farm = cls.env['farm.farm'].create({'name': name})
+        sector_records = cls.env['farm.sector'].create([
+            {'name': f'S{s}', 'farm_id': farm.id} for s in range(sectors)
+        ])
+        unit_records = cls.env['farm.unit'].create([
+            {'name': f'U{u}', 'sector_id': sector.id}
+            for sector in sector_records for u in range(units)
+        ])
+        cls.env['farm.house'].create([
+            {'name': f'H{h}', 'unit_id': unit.id, 'area': area}
+            for unit in unit_records for h in range(houses)
+        ])
+        return farm
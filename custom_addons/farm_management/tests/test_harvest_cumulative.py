@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, timedelta
+
+from odoo.tests import tagged
+
+from .common import FarmHierarchyCommon
+
+
+@tagged('post_install', '-at_install')
+class TestHarvestCumulative(FarmHierarchyCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        farm = cls._create_farm('Farm', houses=2)
+        cls.project = cls.env['farm.project'].create({'name': 'Project', 'farm_id': farm.id})
+        product = cls.env['product.product'].create({'name': 'Tomato', 'detailed_type': 'consu'})
+        houses = farm.sector_ids.unit_ids.house_ids
+        cls.project_houses = cls.env['farm.project.house'].create([{
+            'project_id': cls.project.id,
+            'house_id': house.id,
+            'product_id': product.id,
+            'expected_qty': 1000.0,
+        } for house in houses])
+
+        # Accounts and journal to post project costs
+        cls.payment_account = cls.env['account.account'].create({
+            'name': 'Farm cash', 'code': 'FARM01', 'account_type': 'asset_cash',
+        })
+        cls.cost_account = cls.env['account.account'].create({
+            'name': 'Farm direct costs', 'code': 'FARM02', 'account_type': 'expense_direct_cost',
+            'is_direct_cost': True,
+        })
+        cls.env['account.journal'].create({'name': 'Farm costs', 'code': 'FARMC', 'type': 'general'})
+
+    def _post_cost(self, project_house, amount):
+        cost = self.env['farm.project.cost'].create({
+            'project_id': self.project.id,
+            'cost_type': 'direct',
+            'amount': amount,
+            'source_house_ids': [(6, 0, project_house.house_id.ids)],
+            'payment_account_id': self.payment_account.id,
+            'direct_cost_account_id': self.cost_account.id,
+        })
+        cost.action_post()
+        return cost
+
+    def _create_entries(self, count):
+        start = date(2026, 1, 1)
+        return self.env['farm.harvest.entry'].create([{
+            'project_house_id': self.project_houses[i % 2].id,
+            'date': start + timedelta(days=i // 2),
+            'quantity': 10.0,
+        } for i in range(count)])
+
+    def _assert_compute_queries(self, entries):
+        self.env.flush_all()
+        # Load the dependencies in cache, then mark the running totals to recompute
+        entries.mapped('quantity')
+        entries.mapped('allocated_cost')
+        entries.mapped('expected_qty')
+        for field_name in ('cumulative_harvested', 'cumulative_allocated', 'cumulative_progress'):
+            self.env.add_to_compute(entries._fields[field_name], entries)
+        with self.assertQueryCount(1, flush=False):  # The window query
+            entries.mapped('cumulative_harvested')
+
+    def test_cumulative_values(self):
+        entries = self._create_entries(6)
+        first_house = entries.filtered(lambda e: e.project_house_id == self.project_houses[0])
+        self.assertEqual(first_house.mapped('cumulative_harvested'), [10.0, 20.0, 30.0])
+        self.assertAlmostEqual(first_house[-1].cumulative_progress, 3.0)
+
+    def test_cumulative_query_count(self):
+        """The compute runs one query whatever the number of entries"""
+        self._assert_compute_queries(self._create_entries(5))
+        self._assert_compute_queries(self._create_entries(50))
+
+    def test_allocation_rounding(self):
+        """Allocations are stored rounded to the currency and sum to the house cost"""
+        project_house = self.project_houses[0]
+        entries = self.env['farm.harvest.entry'].create([{
+            'project_house_id': project_house.id,
+            'date': date(2026, 1, day),
+            'quantity': quantity,
+        } for day, quantity in ((1, 333.0), (2, 333.0), (3, 334.0))])
+        self._post_cost(project_house, 100.0)
+        self.env['farm.harvest.entry']._recalculate_cost_allocation(project_house)
+
+        currency = entries[0].currency_id
+        self.assertEqual(entries.mapped('allocated_cost'), [33.3, 22.21, 44.49])
+        for entry in entries:
+            for field_name in ('remaining_cost_before', 'allocated_cost', 'unit_cost', 'cumulative_allocated'):
+                self.assertEqual(entry[field_name], currency.round(entry[field_name]), field_name)
+        self.assertEqual(currency.compare_amounts(sum(entries.mapped('allocated_cost')), 100.0), 0)
+        self.assertEqual(entries[-1].cumulative_allocated, 100.0)
+
+    def test_post_cost_recosts_harvests(self):
+        """Posting and cancelling a cost re-cost the harvests within the transaction"""
+        project_house = self.project_houses[1]
+        entry = self.env['farm.harvest.entry'].create({
+            'project_house_id': project_house.id,
+            'date': date(2026, 1, 1),
+            'quantity': 250.0,
+        })
+        cost = self._post_cost(project_house, 200.0)
+        self.assertEqual(entry.allocated_cost, 50.0)
+        self.assertEqual(project_house.total_allocated_cost, 50.0)
+
+        cost.action_cancel()
+        self.assertEqual(entry.allocated_cost, 0.0)
+        self.assertEqual(project_house.total_allocated_cost, 0.0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from odoo.tests import tagged
+
+from .common import FarmHierarchyCommon
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('post_install', '-at_install')
+class TestHierarchyRename(FarmHierarchyCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env['ir.config_parameter'].sudo().set_param('farm_management.sync_analytic_names', True)
+
+    def _rename_query_count(self, farm, name):
+        self.env.flush_all()
+        start = self.env.cr.sql_log_count
+        farm.write({'name': name})
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - start
+
+    def test_rename_farm_updates_descendants(self):
+        farm = self._create_farm('Farm', sectors=2, units=2, houses=2)
+        farm.write({'name': 'Renamed'})
+
+        houses = self.env['farm.house'].search([('farm_id', '=', farm.id)])
+        self.assertEqual(len(houses), 8)
+        for house in houses:
+            expected = f'Renamed / {house.sector_id.name} / {house.unit_id.name} / {house.name}'
+            self.assertEqual(house.full_name, expected)
+            self.assertEqual(house.analytic_account_id.name, expected)
+
+    def test_move_unit_updates_houses(self):
+        farm = self._create_farm('Farm', sectors=2, units=1, houses=2)
+        first, second = farm.sector_ids
+        unit = first.unit_ids
+        unit.write({'sector_id': second.id})
+
+        self.assertEqual(unit.full_name, f'Farm / {second.name} / {unit.name}')
+        for house in unit.house_ids:
+            self.assertEqual(house.full_name, f'{unit.full_name} / {house.name}')
+            self.assertEqual(house.hierarchy_path, f'/{farm.id}/{second.id}/{unit.id}/')
+
+    def test_rename_farm_benchmark(self):
+        """Renaming a farm of 5,000 houses costs as many queries as a farm of one house"""
+        small = self._create_farm('Small')
+        large = self._create_farm('Large', sectors=10, units=5, houses=100)
+        self.assertEqual(large.house_count, 5000)
+
+        small_count = self._rename_query_count(small, 'Small renamed')
+        started = time.perf_counter()
+        large_count = self._rename_query_count(large, 'Large renamed')
+        elapsed = time.perf_counter() - started
+        _logger.info("Renamed a farm of 5000 houses in %.3fs, %s queries", elapsed, large_count)
+
+        self.assertEqual(large_count, small_count)
+        house = large.sector_ids[:1].unit_ids[:1].house_ids[:1]
+        self.assertTrue(house.full_name.startswith('Large renamed / '))
+        self.assertEqual(house.analytic_account_id.name, house.full_name)
@@ -60,37 +60,25 @@ class FarmImportWizard(models.TransientModel):
         reader = csv.DictReader(csv_file)
         return list(reader)
 
-    def action_import(self):
-        """Import farms with hierarchy from Excel/CSV file"""
-        self.ensure_one()
-        
-        if not self.file:
-            raise UserError(_('الرجاء اختيار ملف'))
-        
-        # Decode file
-        try:
-            file_data = base64.b64decode(self.file)
-            
-            # Determine file type and read data
-            if self.filename and self.filename.lower().endswith('.xlsx'):
-                rows = self._read_xlsx_file(file_data)
-            else:
-                rows = self._read_csv_file(file_data)
-        except Exception as e:
-            raise UserError(_('خطأ في قراءة الملف: %s') % str(e))
-        
+    @api.model
+    def _import_rows(self, numbered_rows):
+        """
+        Import farm hierarchy rows given as [(row_num, row_dict)].
+        Returns (counts, log_messages) where counts has the created farms,
+        sectors, units and houses.
+        """
         log_messages = []
         farms_created = 0
         sectors_created = 0
         units_created = 0
-        houses_created = 0
         
         # Cache for already created records
         farm_cache = {}
         sector_cache = {}
         unit_cache = {}
+        pending_houses = {}  # (unit_id, name) -> (row_num, vals)
         
-        for row_num, row in enumerate(rows, start=2):
+        for row_num, row in numbered_rows:
             try:
                 # Get or create Farm
                 farm_name = row.get('farm_name', '').strip()
@@ -153,9 +141,9 @@ class FarmImportWizard(models.TransientModel):
                         
                         unit_id = unit_cache[unit_key]
                         
-                        # Get or create House
+                        # Get or create House (created together after the loop)
                         house_name = row.get('house_name', '').strip()
-                        if house_name:
+                        if house_name and (unit_id, house_name) not in pending_houses:
                             house = self.env['farm.house'].search([
                                 ('name', '=', house_name),
                                 ('unit_id', '=', unit_id)
@@ -171,7 +159,7 @@ class FarmImportWizard(models.TransientModel):
                                 except:
                                     pass
                                 
-                                house = self.env['farm.house'].create({
+                                pending_houses[(unit_id, house_name)] = (row_num, {
                                     'name': house_name,
                                     'code': row.get('house_code', '').strip() or False,
                                     'unit_id': unit_id,
@@ -179,12 +167,94 @@ class FarmImportWizard(models.TransientModel):
                                     'house_type': house_type,
                                     'description': row.get('house_description', '').strip() or False,
                                 })
-                                houses_created += 1
-                                log_messages.append(f'      ✅ تم إنشاء البيت: {house_name}')
                 
             except Exception as e:
                 log_messages.append(f'❌ خطأ في السطر {row_num}: {str(e)}')
         
+        # One create for all new houses, so their analytic accounts are created in bulk
+        houses_created = self._create_houses(list(pending_houses.values()), log_messages)
+        
+        counts = {
+            'farms': farms_created,
+            'sectors': sectors_created,
+            'units': units_created,
+            'houses': houses_created,
+        }
+        return counts, log_messages
+
+    @api.model
+    def _create_houses(self, numbered_vals, log_messages):
+        """
+        Create the houses given as [(row_num, vals)] with a single create.
+        If the batch fails, the houses are created row by row so the failing
+        rows are reported and the others still imported.
+        """
+        if not numbered_vals:
+            return 0
+        try:
+            with self.env.cr.savepoint():
+                self.env['farm.house'].create([vals for _row_num, vals in numbered_vals])
+        except Exception:
+            created = 0
+            for row_num, vals in numbered_vals:
+                try:
+                    with self.env.cr.savepoint():
+                        self.env['farm.house'].create(vals)
+                    created += 1
+                    log_messages.append(f'      ✅ تم إنشاء البيت: {vals["name"]}')
+                except Exception as e:
+                    log_messages.append(f'❌ خطأ في السطر {row_num}: {str(e)}')
+            return created
+        for _row_num, vals in numbered_vals:
+            log_messages.append(f'      ✅ تم إنشاء البيت: {vals["name"]}')
+        return len(numbered_vals)
+
+    @api.model
+    def _import_rows_job(self, numbered_rows):
+        """Background job step: import a chunk of rows and return its log"""
+        counts, log_messages = self._import_rows(numbered_rows)
+        log_messages.insert(0, _('الأسطر %s - %s: %s مزرعة، %s قطاع، %s وحدة، %s بيت') % (
+            numbered_rows[0][0], numbered_rows[-1][0],
+            counts['farms'], counts['sectors'], counts['units'], counts['houses'],
+        ))
+        return '\n'.join(log_messages)
+
+    def action_import(self):
+        """Import farms with hierarchy from Excel/CSV file"""
+        self.ensure_one()
+        
+        if not self.file:
+            raise UserError(_('الرجاء اختيار ملف'))
+        
+        # Decode file
+        try:
+            file_data = base64.b64decode(self.file)
+            
+            # Determine file type and read data
+            if self.filename and self.filename.lower().endswith('.xlsx'):
+                rows = self._read_xlsx_file(file_data)
+            else:
+                rows = self._read_csv_file(file_data)
+        except Exception as e:
+            raise UserError(_('خطأ في قراءة الملف: %s') % str(e))
+        
+        numbered_rows = [[row_num, row] for row_num, row in enumerate(rows, start=2)]
+        
+        # Large files: import in the background, committed in chunks
+        if self.env['farm.job']._should_defer(len(numbered_rows)):
+            job = self.env['farm.job']._enqueue(
+                _('استيراد المزارع: %s') % (self.filename or ''),
+                'farm.import.wizard', '_import_rows_job', numbered_rows,
+                pass_records=False, chunk_size=200,
+            )
+            return job._notify_enqueued()
+        
+        counts, log_messages = self._import_rows(numbered_rows)
+        farms_created = counts['farms']
+        sectors_created = counts['sectors']
+        units_created = counts['units']
+        houses_created = counts['houses']
+        
         # Summary
         summary = f"""
 ╔══════════════════════════════════════╗